@@ -0,0 +1,4 @@
+import pathlib, sys
+
+# the tools are scripts, not a package: import them the way they import each other
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "tools"))
@@ -0,0 +1,139 @@
+import json, shutil, sys, pathlib
+
+import pytest
+
+import doc_builder
+
+SAMPLES = pathlib.Path(__file__).resolve().parents[1] / "samples"
+
+
+def build(monkeypatch, capsys, *argv):
+    monkeypatch.setattr(sys, "argv", ["doc_builder.py", "--no-link-check", *argv])
+    doc_builder.main()
+    return capsys.readouterr().out
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    shutil.copytree(SAMPLES, tmp_path / "samples")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_manifest_independent_of_root_spelling(tree, monkeypatch, capsys):
+    build(monkeypatch, capsys)
+    out = build(monkeypatch, capsys, "--input-root", str(tree / "samples"), "--output-root", str(tree / "docs"))
+    assert "removed" not in out and "created" not in out
+    out = build(monkeypatch, capsys, "--output-root", str(tree / "docs"), str(tree / "samples" / "fibonacci.py"))
+    assert "up-to-date" in out
+    docs = json.loads((tree / "docs" / doc_builder.MANIFEST_NAME).read_text())["docs"]
+    assert docs["fibonacci.py"]["output"] == "fibonacci.md"
+
+
+def test_legacy_manifest_is_rekeyed(tree, monkeypatch, capsys):
+    build(monkeypatch, capsys)
+    path = tree / "docs" / doc_builder.MANIFEST_NAME
+    docs = json.loads(path.read_text())["docs"]
+    path.write_text(json.dumps({"docs": {f"samples/{k}": {**e, "output": f"docs/{e['output']}"}
+                                         for k, e in docs.items()}}))
+    out = build(monkeypatch, capsys)
+    assert "removed" not in out and out.count("up-to-date") == len(docs)
+    assert json.loads(path.read_text()) == {"version": doc_builder.MANIFEST_VERSION, "docs": docs}
+
+
+TRICKY = r'''# DOC_TITLE: Tricky strings
+import re
+
+### Step one
+def f(x):
+    """Docstring with a # hash.
+# DOC_NOTE: not metadata
+### not a step
+    """
+    a = f"{x:#x} # not a comment"  # hex
+    b = "say \"hi\" # still a string"  # escaped
+    c = 'it\'s # quoted'
+    return a, b, c
+'''
+
+
+def test_hash_inside_strings_is_not_a_comment():
+    model = doc_builder.parse_sample(TRICKY)
+    assert model.meta == {"title": "Tricky strings", "notes": [], "links": []}
+    assert [s[0] for s in model.sections] == ["Prelude", "Step one"]
+    code = model.sections[1][2]
+    assert code[1:5] == ['    """Docstring with a # hash.', "# DOC_NOTE: not metadata", "### not a step", '    """']
+    assert code[5:8] == ['    a = f"{x:#x} # not a comment"', r'    b = "say \"hi\" # still a string"',
+                         r"    c = 'it\'s # quoted'"]
+
+
+def test_comment_columns_match_tokenize():
+    import io, tokenize
+    from languages import PYTHON
+    lines = TRICKY.splitlines()
+    expected = {tok.start[0] - 1: tok.start[1] for tok in tokenize.generate_tokens(io.StringIO(TRICKY).readline)
+                if tok.type == tokenize.COMMENT}
+    assert PYTHON.comment_columns(lines) == expected
+
+
+def test_extract_metadata_reads_only_the_header():
+    lines = ["# DOC_TITLE: Header", "# DOC_LINKS: [a](https://a.example)", "x = 1", "# DOC_TITLE: Later"]
+    assert doc_builder.extract_metadata(lines) == {"title": "Header", "notes": [], "links": ["[a](https://a.example)"]}
+
+
+def test_watcher_rebuilds_only_edited_samples(tree, monkeypatch, capsys):
+    build(monkeypatch, capsys)
+    docs, _ = doc_builder.load_manifest(tree / "docs", tree / "samples")
+    parsed, real = [], doc_builder.parse_sample
+    monkeypatch.setattr(doc_builder, "parse_sample", lambda text, lang: parsed.append(lang) or real(text, lang))
+    watcher = doc_builder.DocWatcher(tree / "samples", tree / "docs", docs)
+    watcher.prime()
+    assert not parsed                                     # priming reads the manifest, not the samples
+
+    fib = tree / "samples" / "fibonacci.py"
+    fib.touch()
+    assert watcher.rebuild({"fibonacci.py"}) == [] and not parsed
+    fib.write_text(fib.read_text() + "print(fib(3))\n")
+    (tree / "samples" / "hello_world.py").unlink()
+    assert watcher.rebuild(watcher.changes()) == ["fibonacci.py", "hello_world.py"] and len(parsed) == 1
+    assert "print(fib(3))" in (tree / "docs" / "fibonacci.md").read_text()
+    assert not (tree / "docs" / "hello_world.md").exists()
+
+
+
+def test_site_index_survives_other_root_spellings_and_bad_entries(tree, monkeypatch, capsys):
+    build(monkeypatch, capsys)
+    manifest = tree / "docs" / doc_builder.MANIFEST_NAME
+    data = json.loads(manifest.read_text())
+    del data["docs"]["hello_world.py"]["index"]["terms"]
+    manifest.write_text(json.dumps(data))
+    with open(tree / "samples" / "fibonacci.py", "a") as fh:
+        fh.write("print(fib(3))\n")
+    out = build(monkeypatch, capsys, "--output-root", str(tree / "docs"), "samples/fibonacci.py")
+    assert "hello_world.py left out of the site index" in out
+    site = json.loads((tree / "docs" / doc_builder.SITE_INDEX_NAME).read_text())["docs"]
+    assert [d["doc"] for d in site] == ["ai_agent.md", "data_processing.md", "fibonacci.md"]
+    assert [d["id"] for d in site] == [0, 1, 2]
+
+
+def test_force_with_explicit_files_keeps_the_rest_of_the_manifest(tree, monkeypatch, capsys):
+    build(monkeypatch, capsys)
+    before = json.loads((tree / "docs" / doc_builder.MANIFEST_NAME).read_text())["docs"]
+    out = build(monkeypatch, capsys, "--force", "samples/fibonacci.py")
+    assert "up-to-date" not in out and "fibonacci.md" in out
+    assert json.loads((tree / "docs" / doc_builder.MANIFEST_NAME).read_text())["docs"].keys() == before.keys()
+    site = json.loads((tree / "docs" / doc_builder.SITE_INDEX_NAME).read_text())["docs"]
+    assert len(site) == len(before)
+
+
+def test_only_rerendered_docs_are_link_checked(tree, monkeypatch, capsys):
+    build(monkeypatch, capsys)
+    checked = []
+    monkeypatch.setattr(doc_builder, "report_links", lambda links, checker: checked.append(sorted(links)))
+    monkeypatch.setattr(sys, "argv", ["doc_builder.py"])
+    doc_builder.main()                                   # nothing changed: no doc is checked
+    assert checked == [[]]
+    src = tree / "samples" / "fibonacci.py"
+    src.write_text(src.read_text() + "\nx = 1\n")
+    doc_builder.main()
+    assert checked[1] == ["fibonacci.py"]
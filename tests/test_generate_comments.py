@@ -0,0 +1,377 @@
+import pytest
+
+import generate_comments_AOAI as gc
+
+
+class FakeBackend:
+    """Answers every request with `reply(user_message)` and records the requests it saw."""
+
+    def __init__(self, reply):
+        self.reply, self.calls = reply, []
+
+    def complete(self, messages, max_tokens, temperature):
+        self.calls.append((messages, max_tokens))
+        return gc.Completion(self.reply(messages[-1]["content"]), "stop", 10, 10)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(reply):
+        fake = FakeBackend(reply)
+        monkeypatch.setattr(gc, "backend", fake)
+        return fake
+    monkeypatch.setattr(gc, "cache", None)
+    return install
+
+
+def test_verify_ignores_final_newline():
+    gc.verify_annotation("x = 1\n", "x = 1")
+    gc.verify_annotation("x = 1", "# set x\nx = 1\n")
+    with pytest.raises(ValueError):
+        gc.verify_annotation("x = 1\n", "x = 2\n")
+
+
+def test_whole_file_keeps_trailing_newline(backend, tmp_path):
+    backend(lambda code: "# add one\n" + code.rstrip("\n"))
+    (tmp_path / "a.py").write_text("def f(x):\n    return x + 1\n")
+    gc.process_file("a.py", tmp_path)
+    assert (tmp_path / "a.py").read_text() == "# add one\ndef f(x):\n    return x + 1\n"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Point the live Azure client at a local aoai_stub server; yields a factory taking StubServer options."""
+    from aoai_stub import serve_in_thread
+    servers = []
+
+    def start(**options):
+        srv = serve_in_thread(**options)
+        servers.append(srv)
+        monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", srv.url)
+        monkeypatch.setenv("AZURE_OPENAI_API_KEY", "stub")
+        for name, value in (("_client", None), ("BACKEND", "azure"), ("deployment_name", "stub"),
+                            ("backend", gc.ClientBackend()), ("cache", None)):
+            monkeypatch.setattr(gc, name, value)
+        return srv
+    yield start
+    for srv in servers:
+        srv.shutdown()
+
+
+def _messages(text):
+    return [{"role": "system", "content": "annotate"}, {"role": "user", "content": text}]
+
+
+def test_retries_throttled_and_failed_requests(stub, monkeypatch):
+    srv = stub(throttle_rate=0.4, error_rate=0.3, retry_after=0, seed=1)
+    monkeypatch.setattr(gc, "scheduler", gc.Scheduler(concurrency=4, max_retries=20))
+    monkeypatch.setattr(gc, "_retry_delay", lambda exc, attempt: 0)    # keep 5xx backoff out of the test
+    assert [gc._complete(_messages(f"x = {i}\n"), 100) for i in range(5)] == [f"x = {i}\n" for i in range(5)]
+    assert srv.stats["throttled"] and srv.stats["errors"]
+    assert srv.stats["requests"] == 5 + srv.stats["throttled"] + srv.stats["errors"]
+
+
+def test_non_retryable_errors_are_raised(stub, monkeypatch):
+    import openai
+    stub(throttle_rate=1.0)
+    monkeypatch.setattr(gc, "scheduler", gc.Scheduler(max_retries=0))
+    with pytest.raises(openai.RateLimitError):
+        gc._complete(_messages("x = 1\n"), 100)
+
+
+def test_retry_delay_honours_retry_after():
+    class Exc(Exception):
+        response = type("R", (), {"headers": {"retry-after": "7"}})()
+    assert gc._retry_delay(Exc(), 0) == 7
+    Exc.response.headers = {"retry-after-ms": "250"}
+    assert gc._retry_delay(Exc(), 0) == 0.25
+
+
+def test_scheduler_caps_requests_in_flight(stub, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    stub(latency=0.1)
+    monkeypatch.setattr(gc, "scheduler", gc.Scheduler(concurrency=2))
+    start = gc.time.perf_counter()
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: gc._complete(_messages(f"x = {i}\n"), 100), range(6)))
+    assert gc.time.perf_counter() - start >= 0.3          # 6 requests, 2 at a time
+
+
+def test_token_bucket_paces_after_burst():
+    bucket = gc.TokenBucket(600)                           # burst of 100, then 10 per second
+    start = gc.time.monotonic()
+    bucket.take(100)
+    bucket.take(2)
+    assert 0.15 <= gc.time.monotonic() - start < 1
+
+
+def test_backfill_applies_and_resumes(stub, tmp_path):
+    srv = stub(batch_delay=0)
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.js").write_text("const b = 2;\n")
+    state_path = tmp_path / "state.json"
+
+    def run():
+        return gc.backfill(["a.py", "b.js"], tmp_path, state_path, batch_size=1, poll_interval=0.01,
+                           batch_deployment="stub")
+    assert run() == 0
+    state = gc.json.loads(state_path.read_text())
+    assert len(state["batches"]) == 2 and srv.stats["requests"] == 0      # everything went through batches
+    assert {rel: e["status"] for rel, e in state["files"].items()} == {"a.py": "applied", "b.js": "applied"}
+
+    assert run() == 0                                     # resumed: nothing left to submit
+    assert len(gc.json.loads(state_path.read_text())["batches"]) == 2
+
+    (tmp_path / "a.py").write_text("a = 3\n")             # edited after it was annotated
+    assert run() == 0
+    state = gc.json.loads(state_path.read_text())
+    assert len(state["batches"]) == 3 and state["files"]["a.py"]["status"] == "applied"
+
+
+def test_rejected_output_is_never_cached(backend, monkeypatch, tmp_path):
+    monkeypatch.setattr(gc, "cache", gc.AnnotationCache(tmp_path / "cache", 1 << 20))
+    fake = backend(lambda code: code.replace("1", "2"))             # always changes the code
+    (tmp_path / "a.py").write_text("x = 1\n")
+    for run in range(2):
+        with pytest.raises(ValueError):
+            gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)
+    assert len(fake.calls) == 2 * (gc.VALIDATION_RETRIES + 1) and gc.cache.hits == 0
+    budgets = [max_tokens for _, max_tokens in fake.calls[:3]]
+    assert budgets == [1000, 2000, 4000]
+    assert len({messages[0]["content"] for messages, _ in fake.calls[:3]}) == 3   # every retry is a new request
+    assert (tmp_path / "a.py").read_text() == "x = 1\n"
+
+
+def test_verified_output_is_cached(backend, monkeypatch, tmp_path):
+    monkeypatch.setattr(gc, "cache", gc.AnnotationCache(tmp_path / "cache", 1 << 20))
+    answers = iter(["x = 2\n", "# one\nx = 1\n"])                   # rejected, then accepted
+    fake = backend(lambda code: next(answers, "# one\nx = 1\n"))
+    (tmp_path / "a.py").write_text("x = 1\n")
+    gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)
+    assert (tmp_path / "a.py").read_text() == "# one\nx = 1\n" and len(fake.calls) == 2
+    (tmp_path / "a.py").write_text("x = 1\n")
+    gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)
+    assert len(fake.calls) == 3 and gc.cache.hits == 0     # the rejected first answer was not kept
+    (tmp_path / "a.py").write_text("x = 1\n")
+    gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)
+    assert len(fake.calls) == 3 and gc.cache.hits == 1
+
+
+def test_recordings_include_cache_hits(backend, monkeypatch, tmp_path):
+    monkeypatch.setattr(gc, "cache", gc.AnnotationCache(tmp_path / "cache", 1 << 20))
+    live = FakeBackend(lambda code: "# one\n" + code)
+    monkeypatch.setattr(gc, "backend", live)
+    (tmp_path / "a.py").write_text("x = 1\n")
+    gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)      # fills the cache only
+
+    (tmp_path / "a.py").write_text("x = 1\n")
+    monkeypatch.setattr(gc, "backend", gc.RecordingBackend(live, tmp_path / "rec"))
+    gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)      # served from the cache
+    assert len(live.calls) == 1 and gc.cache.hits == 1
+
+    (tmp_path / "a.py").write_text("x = 1\n")
+    monkeypatch.setattr(gc, "cache", None)
+    monkeypatch.setattr(gc, "backend", gc.ReplayBackend(tmp_path / "rec"))
+    gc.contextvars.copy_context().run(gc.process_file, "a.py", tmp_path)
+    assert (tmp_path / "a.py").read_text() == "# one\nx = 1\n"
+
+
+def test_replay_miss_is_an_error(monkeypatch, tmp_path):
+    monkeypatch.setattr(gc, "cache", None)
+    monkeypatch.setattr(gc, "backend", gc.ReplayBackend(tmp_path))
+    with pytest.raises(LookupError, match="no recorded response"):
+        gc._complete(_messages("x = 1\n"), 100)
+
+
+MODULE = """\
+import os
+
+### Step one
+# DOC_STEP_SUMMARY: Defines f.
+def f():
+    return 1
+
+x = 1  # inline, not a leading comment
+def g():
+    return 2
+
+# leading comment for h
+@staticmethod
+def h():
+    return 3
+"""
+
+
+def test_split_chunks_boundaries():
+    regions = gc.split_chunks(MODULE, 0)
+    assert "".join(regions) == MODULE
+    assert regions[1].startswith("### Step one\n# DOC_STEP_SUMMARY")
+    assert regions[1].endswith("x = 1  # inline, not a leading comment\n")   # stays out of g's region
+    assert regions[2].startswith("def g():")
+    assert regions[3].startswith("# leading comment for h\n@staticmethod")
+
+
+def test_split_chunks_groups_up_to_max_lines():
+    chunks = gc.split_chunks(MODULE, 8)
+    assert "".join(chunks) == MODULE and len(chunks) == 2
+    assert gc.split_chunks(MODULE, 100) == [MODULE]
+    assert gc.split_chunks("def broken(:\n" * 20, 5) == ["def broken(:\n" * 20]
+
+
+@pytest.mark.parametrize("tail", ["\n", ""])
+def test_chunked_annotation_is_stitched(backend, monkeypatch, tail):
+    fake = backend(lambda chunk: "# chunk\n" + chunk.rstrip("\n"))
+    monkeypatch.setattr(gc, "CHUNK_LINES", 8)
+    code = MODULE.rstrip("\n") + tail
+    result = gc.annotate_source(code)
+    assert len(fake.calls) == 2 and result.count("# chunk\n") == 2
+    assert result.replace("# chunk\n", "") == code
+
+
+def _edit(code, old, new):
+    assert old in code
+    return code.replace(old, new)
+
+
+def test_only_changed_region_is_sent(backend):
+    fake = backend(lambda chunk: "# changed\n" + chunk)
+    code = _edit(MODULE, "return 2", "return 20")
+    result = gc.annotate_changes(code, MODULE)
+    assert len(fake.calls) == 1 and fake.calls[0][0][-1]["content"].startswith("def g():")
+    assert "return 1" not in fake.calls[0][0][-1]["content"] and "return 3" not in fake.calls[0][0][-1]["content"]
+    assert result == _edit(code, "def g():", "# changed\ndef g():")
+
+
+def test_comment_only_edit_makes_no_call(backend):
+    fake = backend(lambda chunk: pytest.fail("nothing should be sent"))
+    code = _edit(MODULE, "# leading comment for h", "# reworded comment for h")
+    assert gc.annotate_changes(code, MODULE) == code and fake.calls == []
+
+
+def test_adjacent_changed_regions_are_one_request(backend):
+    fake = backend(lambda chunk: chunk)
+    code = _edit(_edit(MODULE, "return 2", "return 20"), "return 3", "return 30")
+    assert gc.annotate_changes(code, MODULE) == code
+    assert len(fake.calls) == 1
+    sent = fake.calls[0][0][-1]["content"]
+    assert sent.startswith("def g():") and "return 30" in sent
+
+
+def test_unparseable_baseline_reannotates_everything(backend):
+    fake = backend(lambda chunk: chunk)
+    assert gc.annotate_changes(MODULE, "def broken(:\n") == MODULE
+    assert len(fake.calls) == 1 and fake.calls[0][0][-1]["content"] == MODULE
+
+
+@pytest.mark.parametrize("tail", ["\n", ""])
+def test_changed_regions_keep_final_newline(backend, tail):
+    backend(lambda chunk: "# changed\n" + chunk.rstrip("\n"))
+    code = _edit(MODULE, "return 3", "return 30").rstrip("\n") + tail
+    result = gc.annotate_changes(code, MODULE)
+    assert result == _edit(code, "# leading comment for h", "# changed\n# leading comment for h")
+
+
+def test_pack_files_sends_a_pack_of_one_alone():
+    packs, alone = gc.pack_files({"a.py": 10, "b.py": 20, "c.py": 25, "big.py": 500}, threshold=100, budget=30)
+    assert packs == [["a.py", "b.py"]] and sorted(alone) == ["big.py", "c.py"]
+
+
+def test_split_pack_drops_duplicated_and_missing_files():
+    text = ("# ===== AUTODOCS FILE 1: a.py =====\na = 1\n"
+            "# ===== AUTODOCS FILE 2: b.py =====\nb = 2\n"
+            "# ===== AUTODOCS FILE 2: b.py =====\nb = 2\n")
+    assert gc.split_pack(text, 3) == {1: "a = 1\n"}
+
+
+def _annotate_pack(body):
+    """Comment every file of a packed request, but change the code of b.py."""
+    return gc.PACK_DELIM_RE.sub(lambda m: m.group(0) + "# annotated\n", body).replace("b = 2", "b = 3")
+
+
+def test_pack_retries_only_the_bad_file(backend, tmp_path):
+    fake = backend(_annotate_pack)
+    for name, code in (("a.py", "a = 1\n"), ("b.py", "b = 2\n"), ("c.py", "c = 3\n")):
+        (tmp_path / name).write_text(code)
+    assert gc.process_pack(["a.py", "b.py", "c.py"], tmp_path) == ["b.py"]
+    assert len(fake.calls) == 1
+    assert (tmp_path / "a.py").read_text() == "# annotated\na = 1\n"
+    assert (tmp_path / "b.py").read_text() == "b = 2\n"
+    assert (tmp_path / "c.py").read_text() == "# annotated\nc = 3\n"
+
+
+def test_failed_pack_falls_back_to_single_files(backend, monkeypatch, tmp_path):
+    def reply(body):
+        if gc.PACK_DELIM_RE.search(body):
+            raise RuntimeError("pack rejected")
+        return "# alone\n" + body
+    fake = backend(reply)
+    for name in ("scheduler", "telemetry", "deployment_name", "BACKEND", "CHUNK_LINES", "VALIDATION_RETRIES",
+                 "MAX_OUTPUT_TOKENS"):
+        monkeypatch.setattr(gc, name, getattr(gc, name))            # main() replaces these globals
+    monkeypatch.setattr(gc, "ClientBackend", lambda: fake)
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("b = 2\n")
+    (tmp_path / "list.txt").write_text("a.py\nb.py\n")
+    monkeypatch.setattr(gc.sys, "argv", ["generate_comments_AOAI.py", str(tmp_path / "list.txt"), str(tmp_path),
+                                         "--backend", "azure", "--pack-tokens", "100"])
+    gc.main()
+    assert len(fake.calls) == 3                            # the failed pack, then one request per file
+    assert (tmp_path / "a.py").read_text() == "# alone\na = 1\n"
+    assert (tmp_path / "b.py").read_text() == "# alone\nb = 2\n"
+
+
+def test_unparseable_original_is_still_verified(backend, tmp_path):
+    (tmp_path / "py2.py").write_text("print 'a'\nprint 'b'\n")
+    backend(lambda code: "# say a\n" + code)
+    gc.process_file("py2.py", tmp_path)
+    assert (tmp_path / "py2.py").read_text() == "# say a\nprint 'a'\nprint 'b'\n"
+    backend(lambda code: code.replace("'b'", "'c'"))
+    with pytest.raises(ValueError, match="changed code"):
+        gc.process_file("py2.py", tmp_path)
+    assert (tmp_path / "py2.py").read_text() == "# say a\nprint 'a'\nprint 'b'\n"
+
+
+def test_untokenizable_original_is_never_sent(backend, tmp_path):
+    (tmp_path / "cut.py").write_text("print 'a'\nprint 'b'\nx = [1,\n")
+    fake = backend(lambda code: code)
+    with pytest.raises(ValueError, match="does not tokenize"):
+        gc.process_file("cut.py", tmp_path)
+    assert fake.calls == [] and (tmp_path / "cut.py").read_text() == "print 'a'\nprint 'b'\nx = [1,\n"
+
+
+def test_retry_budget_is_capped(backend, monkeypatch, tmp_path):
+    monkeypatch.setattr(gc, "MAX_OUTPUT_TOKENS", 1500)
+    fake = backend(lambda code: code.replace("1", "2"))             # rejected every time
+    (tmp_path / "a.py").write_text("x = 1\n")
+    with pytest.raises(ValueError):
+        gc.process_file("a.py", tmp_path)
+    assert [max_tokens for _, max_tokens in fake.calls] == [1000, 1500, 1500]
+
+
+def test_cache_is_scoped_to_backend_and_endpoint(backend, monkeypatch, tmp_path):
+    monkeypatch.setattr(gc, "cache", gc.AnnotationCache(tmp_path / "cache", 1 << 20))
+    monkeypatch.setattr(gc, "deployment_name", "gpt-4o")
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com/")
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
+    fake = backend(lambda code: code)
+    for name in ("azure", "azure", "openai"):
+        monkeypatch.setattr(gc, "BACKEND", name)
+        gc.contextvars.Context().run(gc._complete, _messages("x = 1\n"), 100)     # cached at once
+    assert len(fake.calls) == 2 and gc.cache.hits == 1
+
+
+def test_stub_runs_skip_the_cache_and_azure_deployment(monkeypatch, tmp_path):
+    for name in ("scheduler", "telemetry", "backend", "cache", "BACKEND", "CHUNK_LINES", "VALIDATION_RETRIES",
+                 "MAX_OUTPUT_TOKENS", "_client"):
+        monkeypatch.setattr(gc, name, getattr(gc, name))            # main() replaces these globals
+    monkeypatch.setattr(gc, "deployment_name", "prod-gpt4o")
+    monkeypatch.setattr(gc, "cache", None)
+    monkeypatch.setattr(gc, "_client", None)
+    monkeypatch.delenv("OPENAI_MODEL", raising=False)
+    monkeypatch.setenv("OPENAI_BASE_URL", "")                      # main() points it at the stub
+    (tmp_path / "a.py").write_text("x = 1\n")
+    (tmp_path / "list.txt").write_text("a.py\n")
+    monkeypatch.setattr(gc.sys, "argv", ["generate_comments_AOAI.py", str(tmp_path / "list.txt"), str(tmp_path),
+                                         "--backend", "stub", "--cache-dir", str(tmp_path / "cache")])
+    gc.main()
+    assert gc.deployment_name == "local" and gc.cache is None and not (tmp_path / "cache").exists()
@@ -0,0 +1,44 @@
+import pytest
+
+import generate_comments_AOAI as gc
+from languages import CSHARP, GO, JAVASCRIPT, PYTHON, TYPESCRIPT, Language
+
+
+@pytest.mark.parametrize("lang, original, annotated", [
+    (JAVASCRIPT, 'const s = "a  b";\n', '// the greeting\nconst s = "a  b"; // spaced\n'),
+    (JAVASCRIPT, "const a = 1;\nconst b = 2;\n", "const a = 1;\n\n/* then\n   b */\nconst b = 2;\n"),
+    (TYPESCRIPT, "const t = `x\n  y`;\n", "/** template */\nconst t = `x\n  y`;\n"),
+    (GO, "x := 1\ny := 2\n", "// x first\nx := 1 // one\ny := 2\n"),
+    (CSHARP, 'var s = @"a ""b""  c";\n', '// verbatim\nvar s = @"a ""b""  c";\n'),
+])
+def test_comment_only_changes_pass(lang, original, annotated):
+    gc.verify_annotation(original, annotated, lang)
+
+
+@pytest.mark.parametrize("lang, original, annotated", [
+    (JAVASCRIPT, 'const s = "a  b";', 'const s = "a b";'),                  # inside a string literal
+    (TYPESCRIPT, "const t = `x\n  y`;", "const t = `x\ny`;"),                # re-indented template
+    (CSHARP, 'var s = @"a\n    b";', 'var s = @"a\nb";'),                  # re-indented verbatim string
+    (CSHARP, 'var s = """\n  a\n  """;', 'var s = """\n a\n """;'),         # raw string
+    (GO, "s := `a\n  b`", "s := `a\nb`"),                                   # raw string
+    (GO, "x := 1\ny := 2", "x := 1 y := 2"),                                # joined lines
+    (JAVASCRIPT, "return\nx", "return x"),                                  # ASI: not the same program
+    (JAVASCRIPT, "return x", "return /* why\n */ x"),
+])
+def test_code_changes_are_rejected(lang, original, annotated):
+    with pytest.raises(ValueError, match="changed code"):
+        gc.verify_annotation(original, annotated, lang)
+
+
+def test_csharp_ignores_line_breaks():
+    gc.verify_annotation("var x =\n    1;", "var x = 1; // one", CSHARP)
+
+
+def test_language_is_abstract():
+    with pytest.raises(TypeError):
+        Language("Plain", "text", (".txt",), "#")
+
+
+def test_python_comment_spans():
+    text = 's = "# no"  # yes\n# whole line\n'
+    assert [text[a:b] for a, b in PYTHON.comment_spans(text)] == ["# yes", "# whole line"]
@@ -0,0 +1,89 @@
+import collections, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from doc_builder import LinkChecker
+
+
+class Handler(BaseHTTPRequestHandler):
+    """/ok answers both methods, /nohead rejects HEAD with 405, /missing is 404, /slow sleeps first."""
+
+    def log_message(self, *args):
+        pass
+
+    def _answer(self, method):
+        srv, path = self.server, self.path.split("?")[0]
+        with srv.lock:
+            srv.hits[method, path] += 1
+            srv.inflight += 1
+            srv.peak = max(srv.peak, srv.inflight)
+        try:
+            if path == "/slow":
+                time.sleep(0.1)
+            status = 404 if path == "/missing" else 405 if (path, method) == ("/nohead", "HEAD") else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        finally:
+            with srv.lock:
+                srv.inflight -= 1
+
+    def do_HEAD(self):
+        self._answer("HEAD")
+
+    def do_GET(self):
+        self._answer("GET")
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    srv.daemon_threads = True
+    srv.hits, srv.lock, srv.inflight, srv.peak = collections.Counter(), threading.Lock(), 0, 0
+    srv.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_head_rejected_falls_back_to_get(server):
+    checker = LinkChecker()
+    results = checker.check([f"{server.url}/nohead", f"{server.url}/missing"])
+    assert results[f"{server.url}/nohead"] == {"ok": True, "status": 200, "checked": pytest.approx(time.time(), abs=5)}
+    assert results[f"{server.url}/missing"]["status"] == 404 and not results[f"{server.url}/missing"]["ok"]
+    # once GET worked after a rejected HEAD, the host is checked with GET only
+    checker.check([f"{server.url}/ok"])
+    assert server.hits["HEAD", "/ok"] == 0 and server.hits["GET", "/ok"] == 1
+
+
+def test_per_host_cap(server):
+    LinkChecker(workers=8, per_host=2).check([f"{server.url}/slow?{i}" for i in range(8)])
+    assert server.hits["HEAD", "/slow"] == 8
+    assert server.peak == 2
+
+
+def test_duplicates_are_checked_once(server):
+    results = LinkChecker().check([f"{server.url}/ok"] * 3)
+    assert list(results) == [f"{server.url}/ok"]
+    assert server.hits["HEAD", "/ok"] == 1
+
+
+def test_cache_ttl(server, tmp_path):
+    cache, url = tmp_path / "links.json", f"{server.url}/ok"
+    LinkChecker(cache, ttl=60).check([url])
+    checker = LinkChecker(cache, ttl=60)                 # a later run reads the saved result
+    assert checker.check([url])[url]["ok"] and server.hits["HEAD", "/ok"] == 1
+    checker.cache[url]["checked"] -= 120                 # expired: checked again
+    checker.check([url])
+    assert server.hits["HEAD", "/ok"] == 2
+
+
+def test_errors_are_not_cached(server, tmp_path):
+    cache, url = tmp_path / "links.json", f"{server.url}/ok"
+    dead = server.url.rsplit(":", 1)[0] + ":9/ok"        # discard port: the connection is refused
+    checker = LinkChecker(cache, ttl=60, timeout=2)
+    results = checker.check([url, dead])
+    assert "error" in results[dead] and dead not in checker.cache
+    assert set(LinkChecker(cache, ttl=60).cache) == {url}
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Azure OpenAI chat-completions endpoint.
+
+Echoes the user message back unchanged so the commenter can be exercised
+offline, with optional latency and injected 429/500 responses. A minimal fake
+of the Files and Batch endpoints (`/openai/files`, `/openai/batches`) backs
+the commenter's --backfill mode; batches complete `--batch-delay` seconds
+after they are created:
+
+    python tools/aoai_stub.py --port 8089 --latency 0.2 --throttle-rate 0.1
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089 AZURE_OPENAI_API_KEY=stub \\
+    AZURE_OPENAI_DEPLOYMENT_NAME=stub python tools/generate_comments_AOAI.py files.txt .
+
+Every route is also served under `/v1` (plus `GET /v1/models`), so it doubles
+as an OpenAI-compatible server:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python tools/generate_comments_AOAI.py files.txt . --backend openai
+"""
+
+from __future__ import annotations
+import argparse, email.parser, itertools, json, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PREFIX_RE = re.compile(r"^/(?:openai|v1)(?=/)")     # Azure and OpenAI-style routes are served alike
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: "StubServer"
+
+    def log_message(self, fmt, *args):      # keep the console quiet
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path, srv = PREFIX_RE.sub("", self.path.split("?")[0]), self.server
+        parts = path.rstrip("/").split("/")
+        if path.rstrip("/") == "/models":
+            return self._send(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "autodocs"}]})
+        if path.startswith("/files/") and parts[-1] == "content" and parts[-2] in srv.files:
+            data = srv.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            return self.wfile.write(data)
+        if path.startswith("/batches/") and parts[-1] in srv.batches:
+            return self._send(200, srv.poll_batch(parts[-1]))
+        self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body   = self.rfile.read(length)
+        path   = PREFIX_RE.sub("", self.path.split("?")[0])
+        if path.rstrip("/") == "/files":
+            return self._send(200, self.server.add_file(self.headers["Content-Type"], body))
+        payload = json.loads(body or b"{}")
+        if path.rstrip("/") == "/batches":
+            return self._send(200, self.server.add_batch(payload))
+        if not path.endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        srv = self.server
+        srv.count("requests")
+        roll = srv.rng.random()
+        if roll < srv.throttle_rate:
+            srv.count("throttled")
+            return self._send(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                              {"Retry-After": str(srv.retry_after)})
+        if roll < srv.throttle_rate + srv.error_rate:
+            srv.count("errors")
+            return self._send(500, {"error": {"message": "stub server error"}})
+
+        time.sleep(srv.latency)
+        self._send(200, srv.completion(payload))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, throttle_rate: float = 0.0,
+                 error_rate: float = 0.0, retry_after: float = 1, seed: int | None = None,
+                 batch_delay: float = 0.0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency, self.throttle_rate, self.error_rate = latency, throttle_rate, error_rate
+        self.retry_after = retry_after
+        self.rng   = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0}
+        self.batch_delay = batch_delay
+        self.files: dict[str, dict] = {}
+        self.batches: dict[str, dict] = {}
+        self._ids  = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def completion(self, payload: dict) -> dict:
+        """Chat-completion response echoing the last user message."""
+        user = next((m["content"] for m in reversed(payload.get("messages", [])) if m["role"] == "user"), "")
+        prompt_tokens = sum(len(m["content"]) // 4 + 1 for m in payload.get("messages", []))
+        completion_tokens = len(user) // 4 + 1
+        return {
+            "id": f"chatcmpl-stub-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": user}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    # Files / Batch fakes
+    def _store_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        file_id = f"file-stub-{next(self._ids)}"
+        meta = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        with self._lock:
+            self.files[file_id] = {**meta, "content": content}
+        return meta
+
+    def add_file(self, content_type: str, body: bytes) -> dict:
+        msg = email.parser.BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        fields = {part.get_param("name", header="content-disposition"): part for part in msg.get_payload()}
+        upload = fields["file"]
+        return self._store_file(upload.get_filename() or "upload.jsonl",
+                                fields["purpose"].get_payload(decode=True).decode(),
+                                upload.get_payload(decode=True))
+
+    def add_batch(self, payload: dict) -> dict:
+        batch = {"id": f"batch-stub-{next(self._ids)}", "object": "batch", "endpoint": payload["endpoint"],
+                 "input_file_id": payload["input_file_id"], "completion_window": payload["completion_window"],
+                 "status": "in_progress", "created_at": int(time.time()), "output_file_id": None,
+                 "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+        with self._lock:
+            self.batches[batch["id"]] = batch
+        return batch
+
+    def poll_batch(self, batch_id: str) -> dict:
+        """Return the batch, running all of its requests once batch_delay has elapsed."""
+        with self._lock:
+            batch = self.batches[batch_id]
+            if batch["status"] != "in_progress" or time.time() - batch["created_at"] < self.batch_delay:
+                return batch
+            batch["status"] = "finalizing"        # claim it so concurrent polls do not redo the work
+        lines = self.files[batch["input_file_id"]]["content"].decode().splitlines()
+        out = []
+        for ln in filter(None, lines):
+            req = json.loads(ln)
+            out.append(json.dumps({"id": f"req-{next(self._ids)}", "custom_id": req["custom_id"], "error": None,
+                                   "response": {"status_code": 200, "body": self.completion(req["body"])}}))
+        output = self._store_file(f"{batch_id}_output.jsonl", "batch_output", ("\n".join(out) + "\n").encode())
+        with self._lock:
+            batch.update(status="completed", output_file_id=output["id"], completed_at=int(time.time()),
+                         request_counts={"total": len(out), "completed": len(out), "failed": 0})
+        return batch
+
+
+def serve_in_thread(**kwargs) -> StubServer:
+    """Start a StubServer on a background thread and return it (call .shutdown() when done)."""
+    srv = StubServer(**kwargs)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Local Azure OpenAI / OpenAI-compatible chat-completions stub")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.0, help="Seconds to delay each completion")
+    ap.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    ap.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429s")
+    ap.add_argument("--seed", type=int, help="Seed for reproducible failure injection")
+    ap.add_argument("--batch-delay", type=float, default=2.0, help="Seconds before a fake batch job completes")
+    args = ap.parse_args()
+
+    srv = StubServer(args.port, args.latency, args.throttle_rate, args.error_rate, args.retry_after, args.seed,
+                     args.batch_delay)
+    print(f"Stub listening on {srv.url}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Stats: {srv.stats}")
+
+if __name__ == "__main__":
+    main()
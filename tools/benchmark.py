@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+AutoDocs benchmark – time the doc builder and commenter on a synthetic corpus.
+
+Generates annotated samples of configurable size, times the parsing helpers,
+build_doc and full doc_builder.main() runs (cold, warm and with --jobs),
+measures peak memory, and runs the commenter against the local stub LLM
+(tools/aoai_stub.py). Results are printed (or written) as JSON:
+
+    python tools/benchmark.py --files 500 --lines 200 --output bench.json
+
+Startup cost is measured too; `--startup-only --max-startup-ms N` is a quick
+guard that fails if either script imports openai / azure.identity / requests
+at import time or takes longer than N ms to start.
+"""
+
+from __future__ import annotations
+import argparse, contextlib, io, json, os, pathlib, platform, random, shutil, subprocess, sys, tempfile, time, tracemalloc
+
+TOOLS = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(TOOLS))
+import doc_builder                      # noqa: E402
+from languages import CSHARP, GO, JAVASCRIPT, PYTHON   # noqa: E402
+from aoai_stub import serve_in_thread   # noqa: E402
+
+HEAVY_MODULES = ("openai", "azure.identity", "requests")   # must only load on first use
+
+WORDS = ("state agent environment value list result request token cache index step model data "
+         "record buffer config client session parser stream batch window queue worker").split()
+
+
+# Corpus generation
+def _phrase(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def generate_sample(rng: random.Random, lines: int, steps: int, links: int, doc_density: float) -> str:
+    """One annotated sample of roughly `lines` lines split into `steps` steps."""
+    out = [f"# DOC_TITLE: {_phrase(rng, 4).title()}",
+           f"# DOC_SUMMARY: Demonstrates {_phrase(rng, 8)}."]
+    out += [f"# DOC_NOTE: {_phrase(rng, 15)}." for _ in range(max(1, int(lines * doc_density / 4)))]
+    out += [f"# DOC_LINKS: [{_phrase(rng, 2)}](https://example.com/{rng.choice(WORDS)}/{i})" for i in range(links)]
+    out.append("")
+    per_step = max(4, (lines - len(out)) // max(steps, 1))
+    for s in range(steps):
+        out += [f"### Step {s + 1}: {_phrase(rng, 4)}",
+                f"# DOC_STEP_SUMMARY: This step {_phrase(rng, 12)}.",
+                f"def step_{s}(items):",
+                f'    """{_phrase(rng, 6)} # not a comment"""']
+        for i in range(per_step - 4):
+            var = f"{rng.choice(WORDS)}_{i}"
+            if rng.random() < doc_density:
+                out.append(f"    # {_phrase(rng, 6)}")
+            out.append(f'    {var} = [x for x in items if "{rng.choice(WORDS)}#" != x]  # {_phrase(rng, 5)}')
+        out += ["    return items", ""]
+    return "\n".join(out) + "\n"
+
+def to_c_family(text: str) -> str:
+    """Rewrite a generated Python sample with `//` comments and plain strings, for C-family parser timings."""
+    out = []
+    for ln in text.splitlines():
+        if ln.startswith("###"):
+            ln = "// " + ln
+        elif ln.lstrip().startswith("#"):
+            ln = ln.replace("#", "//", 1)
+        out.append(ln.replace("  # ", "  // ").replace('"""', '"'))
+    return "\n".join(out) + "\n"
+
+def generate_corpus(root: pathlib.Path, files: int, lines: int, steps: int, links: int,
+                    doc_density: float, seed: int = 0) -> list[pathlib.Path]:
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = root / f"group{i % 10}" / f"sample_{i:05d}.py"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(generate_sample(rng, lines, steps, links, doc_density), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+# Measurement helpers
+def measure(fn, repeat: int = 1) -> dict:
+    """Best wall-clock of `repeat` runs plus the peak traced memory of the first run."""
+    times = []
+    peak = 0
+    for i in range(repeat):
+        if i == 0:
+            tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if i == 0:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return {"seconds": round(min(times), 6), "runs": repeat, "peak_mb": round(peak / 2**20, 3)}
+
+def run_main(argv: list[str]) -> None:
+    """Invoke doc_builder.main() in-process with its output silenced."""
+    old = sys.argv
+    sys.argv = ["doc_builder.py", *argv]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            doc_builder.main()
+    except SystemExit:
+        pass
+    finally:
+        sys.argv = old
+
+
+def bench_doc_builder(corpus: pathlib.Path, paths: list[pathlib.Path], work: pathlib.Path,
+                      repeat: int, jobs: int) -> dict:
+    texts = [p.read_text(encoding="utf-8").splitlines() for p in paths]
+    out = work / "docs"
+    results = {
+        "extract_metadata": measure(lambda: [doc_builder.extract_metadata(t) for t in texts], repeat),
+        "split_sections":   measure(lambda: [doc_builder.split_sections(t) for t in texts], repeat),
+    }
+    # per-language parse cost on the same corpus, so C-family scanners can be compared with tokenize
+    sources = ["\n".join(t) + "\n" for t in texts]
+    for lang in (PYTHON, JAVASCRIPT, CSHARP, GO):
+        variant = sources if lang is PYTHON else [to_c_family(t) for t in sources]
+        results[f"parse_{lang.fence}"] = measure(lambda: [doc_builder.parse_sample(t, lang) for t in variant], repeat)
+    with contextlib.redirect_stdout(io.StringIO()):     # build_doc prints one line per doc
+        results["build_doc"] = measure(lambda: [doc_builder.build_doc(p, corpus, out) for p in paths], repeat)
+    base = ["--input-root", str(corpus), "--no-link-check"]
+    cold = lambda: (shutil.rmtree(work / "cold", ignore_errors=True),
+                    run_main(base + ["--output-root", str(work / "cold")]))
+    results["main_cold"] = measure(cold, repeat)
+    results["main_warm"] = measure(lambda: run_main(base + ["--output-root", str(work / "cold")]), repeat)
+    if jobs != 1:
+        par = lambda: (shutil.rmtree(work / "par", ignore_errors=True),
+                       run_main(base + ["--output-root", str(work / "par"), "--jobs", str(jobs)]))
+        results[f"main_cold_jobs{jobs}"] = measure(par, repeat)
+    for r in results.values():
+        r["per_file_ms"] = round(1000 * r["seconds"] / len(paths), 4)
+    return results
+
+
+def bench_commenter(corpus: pathlib.Path, paths: list[pathlib.Path], work: pathlib.Path,
+                    latency: float, concurrency: int) -> dict:
+    """Run generate_comments_AOAI.py against the stub LLM on a copy of the corpus."""
+    repo = work / "commenter"
+    shutil.copytree(corpus, repo / "samples")
+    listing = work / "updated_files.txt"
+    listing.write_text("\n".join(f"samples/{p.relative_to(corpus).as_posix()}" for p in paths), encoding="utf-8")
+    recordings = work / "recordings"
+    script = [sys.executable, str(TOOLS / "generate_comments_AOAI.py"), str(listing)]
+    srv = serve_in_thread(latency=latency)
+    env = dict(os.environ, AZURE_OPENAI_ENDPOINT=srv.url, AZURE_OPENAI_API_KEY="stub",
+               AZURE_OPENAI_DEPLOYMENT_NAME="stub")
+    for var in ("AUTODOCS_CACHE_DIR", "AUTODOCS_BACKEND", "AUTODOCS_RECORDINGS"):
+        env.pop(var, None)
+    try:
+        start = time.perf_counter()
+        proc = subprocess.run(script + [str(repo), "--concurrency", str(concurrency), "--recordings", str(recordings)],
+                              env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        srv.shutdown()
+
+    # replay the recorded responses on a fresh copy: the whole commenter with no LLM, network or openai import
+    replay_repo = work / "commenter_replay"
+    shutil.copytree(corpus, replay_repo / "samples")
+    start = time.perf_counter()
+    replay = subprocess.run(script + [str(replay_repo), "--concurrency", str(concurrency),
+                                      "--backend", "replay", "--recordings", str(recordings)],
+                            env=env, capture_output=True, text=True)
+    replay_elapsed = time.perf_counter() - start
+    identical = all((repo / "samples" / p.relative_to(corpus)).read_bytes()
+                    == (replay_repo / "samples" / p.relative_to(corpus)).read_bytes() for p in paths)
+    return {"seconds": round(elapsed, 4), "exit_code": proc.returncode, "llm_latency": latency,
+            "concurrency": concurrency, "requests": srv.stats["requests"],
+            # time not explained by the simulated LLM latency
+            "overhead_seconds": round(elapsed - latency * srv.stats["requests"] / concurrency, 4),
+            "replay": {"seconds": round(replay_elapsed, 4), "exit_code": replay.returncode,
+                       "identical_output": identical}}
+
+
+def bench_startup(repeat: int) -> dict:
+    """Best-of-`repeat` process start times (ms, interpreter start subtracted) and eagerly loaded heavy modules."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("AZURE_", "AUTODOCS_"))}
+
+    def best_ms(cmd: list[str], **kw) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(cmd, env=env, capture_output=True, **kw)
+            times.append(time.perf_counter() - start)
+        return 1000 * min(times)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        empty = pathlib.Path(tmp) / "empty.txt"
+        empty.write_text("")
+        (pathlib.Path(tmp) / "samples").mkdir()
+        interpreter = best_ms([sys.executable, "-c", "pass"])
+        scenarios = {
+            "commenter_help":       [sys.executable, str(TOOLS / "generate_comments_AOAI.py"), "--help"],
+            "commenter_usage_error": [sys.executable, str(TOOLS / "generate_comments_AOAI.py")],
+            "commenter_empty_list": [sys.executable, str(TOOLS / "generate_comments_AOAI.py"), str(empty), tmp],
+            "doc_builder_help":     [sys.executable, str(TOOLS / "doc_builder.py"), "--help"],
+            "doc_builder_empty":    [sys.executable, str(TOOLS / "doc_builder.py"), "--input-root",
+                                     str(pathlib.Path(tmp) / "samples"), "--output-root", str(pathlib.Path(tmp) / "docs")],
+        }
+        results = {name: round(best_ms(cmd, cwd=tmp) - interpreter, 2) for name, cmd in scenarios.items()}
+    probe = subprocess.run([sys.executable, "-c",
+                            f"import sys; sys.path.insert(0, {str(TOOLS)!r}); "
+                            "import generate_comments_AOAI, doc_builder; "
+                            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"],
+                           env=env, capture_output=True, text=True)
+    return {"interpreter_ms": round(interpreter, 2), "scenarios_ms": results,
+            "heavy_modules_at_import": [m for m in probe.stdout.strip().split(",") if m]}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the AutoDocs pipeline on a synthetic corpus")
+    ap.add_argument("--files", type=int, default=200, help="Number of sample files")
+    ap.add_argument("--lines", type=int, default=120, help="Approximate lines per file")
+    ap.add_argument("--steps", type=int, default=4, help="### Step sections per file")
+    ap.add_argument("--links", type=int, default=2, help="DOC_LINKS per file")
+    ap.add_argument("--doc-density", type=float, default=0.1, help="Fraction of lines with extra comments / DOC_NOTEs")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    ap.add_argument("--jobs", type=int, default=0, help="--jobs value for the parallel build (0 = CPU count)")
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="Stub LLM seconds per request")
+    ap.add_argument("--concurrency", type=int, default=8, help="Commenter --concurrency")
+    ap.add_argument("--skip-commenter", action="store_true", help="Only benchmark the doc builder")
+    ap.add_argument("--startup-only", action="store_true", help="Only measure script startup")
+    ap.add_argument("--max-startup-ms", type=float,
+                    help="Exit 1 if any startup scenario exceeds this (ms above bare interpreter start) "
+                         "or a heavy dependency is imported eagerly")
+    ap.add_argument("--workdir", help="Keep the corpus and outputs here instead of a temp dir")
+    ap.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = ap.parse_args()
+
+    report = {
+        "version": subprocess.run(["git", "-C", str(TOOLS), "describe", "--always", "--dirty"],
+                                  capture_output=True, text=True).stdout.strip() or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "startup": bench_startup(args.repeat),
+    }
+    if not args.startup_only:
+        with contextlib.ExitStack() as stack:
+            work = pathlib.Path(args.workdir) if args.workdir else pathlib.Path(stack.enter_context(tempfile.TemporaryDirectory()))
+            corpus = work / "samples"
+            shutil.rmtree(corpus, ignore_errors=True)
+            paths = generate_corpus(corpus, args.files, args.lines, args.steps, args.links, args.doc_density, args.seed)
+
+            report["corpus"] = {"files": args.files, "lines": args.lines, "steps": args.steps, "links": args.links,
+                                "doc_density": args.doc_density, "seed": args.seed,
+                                "bytes": sum(p.stat().st_size for p in paths)}
+            report["doc_builder"] = bench_doc_builder(corpus, paths, work, args.repeat, args.jobs)
+            if not args.skip_commenter:
+                report["commenter"] = bench_commenter(corpus, paths, work, args.llm_latency, args.concurrency)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.max_startup_ms is not None:
+        startup = report["startup"]
+        slow = {k: v for k, v in startup["scenarios_ms"].items() if v > args.max_startup_ms}
+        for name, ms in slow.items():
+            print(f"::error::startup scenario {name} took {ms:.0f}ms (limit {args.max_startup_ms:.0f}ms)", file=sys.stderr)
+        for mod in startup["heavy_modules_at_import"]:
+            print(f"::error::{mod} is imported at module load; import it where it is first used", file=sys.stderr)
+        if slow or startup["heavy_modules_at_import"]:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
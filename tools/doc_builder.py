@@ -1,63 +1,164 @@
 #!/usr/bin/env python
 """
-AutoDocs – turn commented Python samples into Markdown docs (docs/ folder).
+AutoDocs – turn commented code samples (Python, JavaScript/TypeScript, C#, Go) into Markdown docs (docs/ folder).
 """
 
 from __future__ import annotations
-import argparse, datetime, pathlib, re, sys
-import requests
+import argparse, contextlib, datetime, hashlib, io, itertools, json, os, pathlib, re, sys, tempfile, threading, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
 from urllib.parse import urlparse
+from telemetry import Telemetry
+from languages import LANGUAGES, PYTHON, Language, language_for
 
-# regex patterns
-TITLE_RE   = re.compile(r"^#\s*DOC_TITLE:\s*(.+)",            re.I)
-SUMMARY_RE = re.compile(r"^#\s*DOC_(SUMMARY|BLURB):\s*(.+)",  re.I)
-NOTES_RE   = re.compile(r"^#\s*DOC_NOTES?:\s*(.+)",           re.I)
-LINKS_RE   = re.compile(r"^#\s*DOC_LINKS?:\s*(.+)",           re.I)
-STEP_RE    = re.compile(r"^\s*###\s+(.*)")                    # ### Step heading
-STEP_SUMMARY_RE = re.compile(r"^#\s*DOC_STEP_SUMMARY:\s*(.+)", re.I)
+# DOC_* tag -> model key; the per-language tag and `### Step` regexes live in languages.py
+META_KEYS = {"TITLE": "title", "SUMMARY": "summary", "BLURB": "summary", "NOTE": "notes", "NOTES": "notes",
+             "LINK": "links", "LINKS": "links", "STEP_SUMMARY": "step_summary"}
 
-# helper: any metadata line?
-def _is_meta(line: str) -> bool:
-    return any(r.match(line) for r in (TITLE_RE, SUMMARY_RE, NOTES_RE, LINKS_RE, STEP_SUMMARY_RE))
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
 
-def validate_links(links: list[str]) -> list[tuple[str, str, bool]]:
-    """Validate links and return (link_text, url, is_valid) tuples."""
-    results = []
-    url_pattern = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
-    
-    for link in links:
-        match = url_pattern.match(link.strip())
-        if match:
-            link_text, url = match.groups()
-            is_valid = False
+def parse_link(link: str) -> tuple[str, str] | None:
+    """Split a `[text](url)` link into (text, url), adding https:// when the scheme is missing."""
+    match = LINK_RE.match(link.strip())
+    if not match:
+        return None
+    link_text, url = match.groups()
+    if not urlparse(url).scheme:
+        url = 'https://' + url
+    return link_text, url
+
+class LinkChecker:
+    """Checks URLs concurrently through one pooled session.
+
+    Requests to a single host are capped at `per_host` in flight, hosts that
+    reject HEAD are retried (and thereafter checked) with GET, and results are
+    kept in an optional JSON cache for `ttl` seconds. Network errors, 429s and
+    5xx answers are transient, so they are never cached.
+    """
+
+    HEAD_REJECTED = {400, 403, 404, 405, 501}   # statuses some servers return only for HEAD
+
+    def __init__(self, cache_path: pathlib.Path | None = None, ttl: float = 86400,
+                 workers: int = 16, per_host: int = 4, timeout: float = 10):
+        self.cache_path, self.ttl, self.workers, self.timeout = cache_path, ttl, workers, timeout
+        self.per_host = per_host
+        self.session = None                      # created on the first network check
+        self._hosts: dict[str, threading.Semaphore] = {}
+        self._get_only: set[str] = set()
+        self._lock = threading.Lock()
+        self.cache: dict[str, dict] = {}
+        if cache_path and cache_path.exists():
             try:
-                # Add scheme if missing
-                if not urlparse(url).scheme:
-                    url = 'https://' + url
-                
-                response = requests.head(url, timeout=10, allow_redirects=True)
-                is_valid = response.status_code < 400
-            except Exception as e:
-                print(f"Warning: Could not validate link '{link_text}' ({url}): {e}")
-            
-            results.append((link_text, url, is_valid))
-        else:
+                self.cache = json.loads(cache_path.read_text(encoding="utf-8"))
+            except ValueError:
+                pass
+
+    @staticmethod
+    def _cacheable(result: dict) -> bool:
+        return "status" in result and result["status"] < 500 and result["status"] != 429
+
+    def _host_slot(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            return self._hosts.setdefault(host, threading.Semaphore(self.per_host))
+
+    def _open_session(self) -> None:
+        import requests                          # only paid for when a link actually needs checking
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "AutoDocs link checker"
+
+    def _check_one(self, url: str) -> dict:
+        import requests
+        host = urlparse(url).netloc
+        with self._host_slot(host):
+            try:
+                status = None
+                if host not in self._get_only:
+                    status = self.session.head(url, timeout=self.timeout, allow_redirects=True).status_code
+                if status is None or status in self.HEAD_REJECTED:
+                    with self.session.get(url, timeout=self.timeout, allow_redirects=True, stream=True) as resp:
+                        if status is not None and resp.status_code < 400:
+                            with self._lock:
+                                self._get_only.add(host)
+                        status = resp.status_code
+                return {"ok": status < 400, "status": status, "checked": time.time()}
+            except requests.RequestException as e:
+                return {"ok": False, "error": str(e), "checked": time.time()}
+
+    def check(self, urls) -> dict[str, dict]:
+        """Return {url: result} for the unique URLs given, using cached results that are still fresh."""
+        urls = list(dict.fromkeys(urls))
+        now = time.time()
+        results = {u: self.cache[u] for u in urls if u in self.cache and now - self.cache[u]["checked"] < self.ttl
+                   and self._cacheable(self.cache[u])}
+        todo = [u for u in urls if u not in results]
+        if todo:
+            if self.session is None:
+                self._open_session()
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results.update(zip(todo, pool.map(self._check_one, todo)))
+            self.cache.update((u, results[u]) for u in todo if self._cacheable(results[u]))
+            self.save()
+        return results
+
+    def save(self) -> None:
+        if not self.cache_path:
+            return
+        now = time.time()
+        fresh = {u: r for u, r in self.cache.items() if now - r["checked"] < self.ttl and self._cacheable(r)}
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(fresh, fh, sort_keys=True)
+        os.replace(tmp, self.cache_path)
+
+def validate_links(links: list[str], checker: LinkChecker | None = None) -> list[tuple[str, str, bool]]:
+    """Validate links and return (link_text, url, is_valid) tuples."""
+    parsed = [parse_link(link) for link in links]
+    for link, p in zip(links, parsed):
+        if p is None:
             print(f"Warning: Invalid link format: {link}")
-            results.append((link, "", False))
-    
-    return results
-
-def remove_inline_comments(line: str) -> str:
-    """Remove inline comments from a line, preserving string literals."""
-    in_single = in_double = False
-    for i, c in enumerate(line):
-        if c == '"' and not in_single:
-            in_double = not in_double
-        elif c == "'" and not in_double:
-            in_single = not in_single
-        elif c == '#' and not in_single and not in_double:
-            return line[:i].rstrip()
-    return line.rstrip()
+    results = (checker or LinkChecker()).check(p[1] for p in parsed if p)
+    out = []
+    for link, p in zip(links, parsed):
+        if p is None:
+            out.append((link, "", False))
+            continue
+        link_text, url = p
+        res = results[url]
+        if "error" in res:
+            print(f"Warning: Could not validate link '{link_text}' ({url}): {res['error']}")
+        out.append((link_text, url, res["ok"]))
+    return out
+
+def report_links(docs: dict[str, list[str]], checker: LinkChecker) -> int:
+    """Check the links of several docs in one deduplicated pass; print broken ones and return their count."""
+    parsed = {src: [(link, parse_link(link)) for link in links] for src, links in docs.items() if links}
+    urls = {p[1] for pairs in parsed.values() for _, p in pairs if p}
+    if not parsed:
+        return 0
+    print(f"Validating {len(urls)} unique link(s) across {len(parsed)} doc(s)...")
+    results = checker.check(sorted(urls))
+    broken_total = 0
+    for src, pairs in parsed.items():
+        broken = []
+        for link, p in pairs:
+            if p is None:
+                broken.append((link, "invalid link format"))
+            elif not results[p[1]]["ok"]:
+                res = results[p[1]]
+                broken.append((p[0], f"{p[1]} ({res.get('status') or res.get('error')})"))
+        if broken:
+            print(f" Broken links found in {src}:")
+            for text, detail in broken:
+                print(f"     - {text}: {detail}")
+        broken_total += len(broken)
+    if not broken_total:
+        print(" All links are valid")
+    return broken_total
 
 # Markdown template
 MD_TEMPLATE = """\
@@ -74,30 +175,146 @@ MD_TEMPLATE = """\
 {links_block}
 <details><summary>Full source</summary>
 
-```python
+```{fence}
 {full_source}
 ```
 </details>
 Last updated: {timestamp}
 """
 
-#Helper functions:
+telemetry = Telemetry("doc_builder")
+
+# Build manifest: per-source record of what was rendered, so unchanged docs are skipped
+MANIFEST_NAME = ".autodocs-manifest.json"
+MANIFEST_VERSION = 2        # keys are relative to --input-root, outputs to --output-root
+TIMESTAMP_RE  = re.compile(r"^Last updated: .*$", re.M)
+
+def _sha(data: str | bytes) -> str:
+    return hashlib.sha256(data.encode("utf-8") if isinstance(data, str) else data).hexdigest()
+
+# Any change to the template, this builder or the language plugins (the parsers) invalidates every manifest entry
+TEMPLATE_VERSION = _sha(MD_TEMPLATE.encode("utf-8") + pathlib.Path(__file__).read_bytes()
+                        + pathlib.Path(__file__).with_name("languages.py").read_bytes())[:16]
+
+def _output_hash(md: str) -> str:
+    """Hash of a rendered doc, ignoring its 'Last updated' stamp."""
+    return _sha(TIMESTAMP_RE.sub("", md))
+
+def sample_key(sample: pathlib.Path, in_root: pathlib.Path) -> str:
+    """Manifest key of `sample`: its path under `in_root`, however either was spelled on the command line."""
+    try:
+        return sample.resolve().relative_to(in_root.resolve()).as_posix()
+    except ValueError:
+        return sample.resolve().as_posix()                  # listed explicitly from outside the input root
+
+def load_manifest(out_root: pathlib.Path, in_root: pathlib.Path) -> tuple[dict[str, dict], bool]:
+    """Return (entries, whether the file is in the current format and needs no rewrite)."""
+    try:
+        data = json.loads((out_root / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}, True
+    docs = data.get("docs", {})
+    current = data.get("version", 1) == MANIFEST_VERSION
+    if not current:
+        # v1 stored paths as typed on the command line: re-key them so the first run does not prune everything
+        docs = {sample_key(pathlib.Path(k), in_root): {**e, "output": e["output"] and pathlib.Path(e["output"]).name}
+                for k, e in docs.items()}
+    return docs, current
+
+def _write_json(path: pathlib.Path, data, **dump_args) -> None:
+    """Atomically replace `path` with `data` as JSON (world-readable, unlike a bare mkstemp file)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, sort_keys=True, **dump_args)
+        fh.write("\n")
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+def save_manifest(out_root: pathlib.Path, docs: dict[str, dict]) -> None:
+    _write_json(out_root / MANIFEST_NAME, {"version": MANIFEST_VERSION, "docs": docs}, indent=1)
+
+def prune_doc(out_root: pathlib.Path, key: str, entry: dict) -> None:
+    """Remove the doc generated for a source that no longer exists."""
+    if entry.get("output"):
+        out = out_root / entry["output"]
+        if out.exists():
+            out.unlink()
+            print(f"removed {out} (source {key} deleted)")
+
+# Single-pass parser
 
-def extract_metadata(lines: list[str]) -> dict[str, list[str] | str]:
-    """Pull DOC_* tags from the top comments."""
+class SampleModel(NamedTuple):
+    """Parsed sample: header metadata, step sections and the metadata-free source."""
+    meta: dict[str, list[str] | str]
+    sections: list[tuple[str, list[str], list[str], str]]
+    source: str
+    language: Language = PYTHON
+
+def parse_sample(text: str, lang: Language = PYTHON) -> SampleModel:
+    """Parse a commented sample into a SampleModel in one sweep over its lines.
+
+    Metadata is read from the leading comment block; DOC_* lines anywhere are
+    dropped from the source and sections. Each section is
+    (heading, summary_lines, code_lines, step_summary), where summary_lines
+    are its leading comments and code_lines the rest with comments removed.
+    Comment syntax comes from the `lang` plugin.
+    """
+    lines = text.splitlines()
+    cols = lang.comment_columns(lines)
     meta: dict[str, list[str] | str] = {"notes": [], "links": []}
-    for ln in lines:
-        if m := TITLE_RE.match(ln):
-            meta["title"] = m.group(1).strip()
-        elif m := SUMMARY_RE.match(ln):
-            meta["summary"] = m.group(2).strip()
-        elif m := NOTES_RE.match(ln):
-            meta["notes"].append(m.group(1).strip())
-        elif m := LINKS_RE.match(ln):
-            meta["links"].append(m.group(1).strip())
-        elif not ln.startswith("#"): # real code starts → stop scanning
-            break
-    return meta
+    source: list[str] = []
+    sections: list[tuple[str, list[str], list[str], str]] = []
+    hdr, summary, code, step_summary = "Prelude", [], [], ""
+    in_header = in_summary = True
+
+    for i, ln in enumerate(lines):
+        col = cols.get(i)
+        if col is None:                             # no comment on this line: the common case
+            in_header = False
+            source.append(ln)
+            if in_summary and not ln.strip():
+                summary.append("")
+            else:
+                in_summary = False
+                code.append(ln.rstrip())
+            continue
+        if col == 0 and (m := lang.meta_re.match(ln)):
+            key, value = META_KEYS[m.group(1).upper()], m.group(2).strip()
+            if key == "step_summary":
+                step_summary = value
+            elif in_header and key in ("notes", "links"):
+                meta[key].append(value)
+            elif in_header:
+                meta[key] = value
+            continue
+        in_header = in_header and lang.is_comment_line(ln)   # real code starts → header ends
+        source.append(ln)
+
+        comment_only = col is not None and not ln[:col].strip()
+        if comment_only and (m := lang.step_re.match(ln[col:])):
+            while summary and not summary[-1]:
+                summary.pop()
+            sections.append((hdr, summary, code, step_summary))
+            hdr, summary, code, step_summary = m.group(1).strip(), [], [], ""
+            in_summary = True
+        elif in_summary and comment_only:
+            summary.append(lang.comment_text(ln[col:]))
+        elif in_summary and not ln.strip():
+            summary.append("")                      # allow blank lines in summary
+        else:
+            in_summary = False
+            code.append(ln[:col].rstrip())
+
+    while summary and not summary[-1]:
+        summary.pop()
+    sections.append((hdr, summary, code, step_summary))
+    return SampleModel(meta, sections, "\n".join(source), lang)
+
+def extract_metadata(lines: list[str], lang: Language = PYTHON) -> dict[str, list[str] | str]:
+    """Pull DOC_* tags from the top comments, reading no further than the end of that block."""
+    header = itertools.takewhile(lang.is_comment_line, lines)
+    return parse_sample("\n".join(header), lang).meta
 
 def split_sections(lines: list[str]) -> list[tuple[str, list[str], list[str], str]]:
     """Return [(heading, summary_lines, code_lines, step_summary)] blocks, incl. pre‑heading code as 'Prelude'.
@@ -105,83 +322,26 @@ def split_sections(lines: list[str]) -> list[tuple[str, list[str], list[str], st
     code_lines: rest of the code in the section (comments removed).
     step_summary: DOC_STEP_SUMMARY metadata for the section.
     """
-    sections: list[tuple[str, list[str], list[str], str]] = []
-    hdr: str = "Prelude"
-    block: list[str] = []
-    current_step_summary: str = ""
-    
-    for ln in lines:
-        if _is_meta(ln): #skip metadata lines entirely
-            # Check if this is a step summary for the current section
-            if m := STEP_SUMMARY_RE.match(ln):
-                current_step_summary = m.group(1).strip()
-            continue
-        if m := STEP_RE.match(ln):
-            sections.append((hdr, [], block, current_step_summary))  # summary will be extracted later
-            hdr, block = m.group(1).strip(), []
-            current_step_summary = ""  # Reset for next section
-        else:
-            block.append(ln)
-    sections.append((hdr, [], block, current_step_summary))
-
-    # Extract summary and code for each section
-    def extract_summary_and_code(block: list[str]) -> tuple[list[str], list[str]]:
-        summary = []
-        code = []
-        in_summary = True
-        for ln in block:
-            if in_summary and ln.strip().startswith("#") and not _is_meta(ln):
-                summary.append(ln.lstrip("# ").rstrip())
-            elif ln.strip() == '' and in_summary:
-                # allow blank lines in summary
-                summary.append('')
-            else:
-                in_summary = False
-                code.append(ln)
-        # Remove trailing blank lines from summary
-        while summary and summary[-1].strip() == '':
-            summary.pop()
-        return summary, code
-
-    result = []
-    for hdr, _, block, step_summary in sections:
-        summary, code = extract_summary_and_code(block)
-        result.append((hdr, summary, code, step_summary))
-    return result
-
-
-def build_doc(sample: pathlib.Path, in_root: pathlib.Path, out_root: pathlib.Path) -> None:
-    """Convert one Python sample into its .md doc."""
-    lines = sample.read_text().splitlines()
-    meta = extract_metadata(lines)
-    if "title" not in meta:
-        print(f"‑ Skipping {sample} (no DOC_TITLE)")
-        return
+    return parse_sample("\n".join(lines)).sections
 
-    # filter metadata from full‑source accordion as well
-    clean_source = "\n".join(ln for ln in lines if not _is_meta(ln))
 
-    # build step blocks
-    step_md: list[str] = []
-    sections = split_sections(lines)
+def doc_steps(model: SampleModel) -> list[tuple[int, str, str, str]]:
+    """The steps a doc shows, as (number, heading, summary, code) – shared by render_doc and the site index."""
+    steps = []
+    sections = model.sections
     # Prelude suppression: skip if first section is Prelude and has no real code
     start_idx = 0
     if sections:
-        prelude_hdr, prelude_summary, prelude_code, prelude_step_summary = sections[0]
-        if prelude_hdr == "Prelude":
-            # Check if prelude_code is empty or only whitespace/comments
-            if not any(ln.strip() and not ln.strip().startswith('#') for ln in prelude_code):
-                start_idx = 1  # skip Prelude
+        prelude_hdr, _, prelude_code, _ = sections[0]
+        if prelude_hdr == "Prelude" and not any(ln.strip() for ln in prelude_code):
+            start_idx = 1  # skip Prelude
     for idx, (hdr, summary_lines, code_lines, step_summary) in enumerate(sections[start_idx:], 1):
         if not hdr or (not code_lines and not summary_lines):
             continue
         
         # Clean the header - remove any existing numbering like "Step 1: " or "1. "
         clean_header = re.sub(r'^(Step \d+:\s*|\d+\.\s*)', '', hdr.strip())
-        
-        # Remove inline comments from code lines for step blocks (keep full source intact)
-        clean_code_lines = [remove_inline_comments(line) for line in code_lines]
-        snippet = "\n".join(clean_code_lines)
+        snippet = "\n".join(code_lines)
         
         # Use the step summary from metadata if available, otherwise fall back to simple header
         if step_summary:
@@ -189,50 +349,284 @@ def build_doc(sample: pathlib.Path, in_root: pathlib.Path, out_root: pathlib.Pat
         else:
             # Fallback: create a simple summary from the header
             summary_text = f"This step {clean_header.lower().replace('define', 'defines').replace('create', 'creates').replace('run', 'runs').replace('execute', 'executes')}."
-        
-        step_md.append(
-            f"### Step {idx}: {clean_header}\n"
-            + f"{summary_text}\n\n"
-            + (f"```python\n{snippet}\n```\n" if snippet.strip() else "")
-        )
-
-    md = MD_TEMPLATE.format(
-        source_rel   = sample.relative_to(in_root),
-        title        = meta.get("title", sample.stem),
+        steps.append((idx, clean_header, summary_text, snippet))
+    return steps
+
+
+def render_doc(model: SampleModel, source_rel: pathlib.Path | str) -> str:
+    """Render a parsed sample into its Markdown doc."""
+    meta = model.meta
+    step_md = [
+        f"### Step {idx}: {clean_header}\n"
+        + f"{summary_text}\n\n"
+        + (f"```{model.language.fence}\n{snippet}\n```\n" if snippet.strip() else "")
+        for idx, clean_header, summary_text, snippet in doc_steps(model)
+    ]
+
+    return MD_TEMPLATE.format(
+        source_rel   = source_rel,
+        title        = meta["title"],
         summary_block= f"_{meta.get('summary','')}_\n" if meta.get("summary") else "",
         notes_block  = ("\n\n**Notes:**\n" + "\n".join(f"> {n}" for n in meta["notes"]) + "\n") if meta["notes"] else "",
         steps_block  = "\n".join(step_md),
         links_block  = ("## Resources\n" +
                     "\n".join(f"* {l}" for l in meta["links"]) + "\n") if meta["links"] else "",
-        full_source  = clean_source,
+        full_source  = model.source,
+        fence        = model.language.fence,
         timestamp    = datetime.date.today().isoformat(),
     )
 
-    # Validate links and report broken ones
-    if meta["links"]:
-        print(f"Validating {len(meta['links'])} links for {sample.name}...")
-        link_results = validate_links(meta["links"])
-        broken_links = [(text, url) for text, url, is_valid in link_results if not is_valid]
-        if broken_links:
-            print(f" Broken links found:")
-            for text, url in broken_links:
-                print(f"     - {text}: {url}")
-        else:
-            print(f" All links are valid")
 
-    dst = out_root / f"{sample.stem}.md"              # flat docs/ folder
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    dst.write_text(md, encoding="utf-8")
-    action = "updated" if dst.exists() else "created"
-    print(f"{action} {dst}")
+# Site index: navigation data and an inverted search index, derived from the manifest
+SITE_INDEX_NAME   = "site-index.json"
+SEARCH_INDEX_NAME = "search-index.json"
+WORD_RE   = re.compile(r"[a-z0-9]{2,}")
+STOPWORDS = frozenset("an and are as at be by for from has in is it its of on or that the this to was with".split())
+
+def _terms(text: str, weight: int, into: dict[str, int]) -> None:
+    for word in WORD_RE.findall(text.lower()):
+        if word not in STOPWORDS:
+            into[word] = into.get(word, 0) + weight
+
+def index_fields(model: SampleModel) -> dict:
+    """Navigation fields and weighted search terms for one doc (stored in its manifest entry)."""
+    meta, steps = model.meta, doc_steps(model)
+    terms: dict[str, int] = {}
+    _terms(meta["title"], 5, terms)
+    _terms(meta.get("summary", ""), 3, terms)
+    for _, heading, summary, _ in steps:
+        _terms(heading, 3, terms)
+        _terms(summary, 1, terms)
+    for note in meta["notes"]:
+        _terms(note, 1, terms)
+    return {"title": meta["title"], "summary": meta.get("summary", ""),
+            "steps": [heading for _, heading, _, _ in steps], "terms": terms}
+
+def write_site_index(out_root: pathlib.Path, docs: dict[str, dict]) -> None:
+    """Write site-index.json and search-index.json from the manifest entries, without re-parsing anything.
+
+    The search index maps each term to flat [doc id, weight, ...] postings, where
+    doc ids are positions in the site index's "docs" list. Malformed entries are
+    left out with a warning rather than failing the build.
+    """
+    site, postings = [], {}
+    for key, e in sorted(docs.items()):
+        if not e.get("output") or "index" not in e:
+            continue
+        try:
+            idx = e["index"]
+            links = [{"text": p[0], "url": p[1]} if (p := parse_link(l)) else {"text": l, "url": ""}
+                     for l in e["links"]]
+            doc = {"id": len(site), "doc": e["output"], "source": key, "title": idx["title"],
+                   "summary": idx["summary"], "steps": idx["steps"], "links": links, "hash": e["output_hash"]}
+            terms = list(idx["terms"].items())
+        except (KeyError, TypeError, AttributeError) as exc:
+            print(f"Warning: {key} left out of the site index (bad manifest entry: {exc!r})")
+            continue
+        site.append(doc)
+        for term, weight in terms:
+            postings.setdefault(term, []).extend((doc["id"], weight))
+    _write_json(out_root / SITE_INDEX_NAME, {"version": 1, "docs": site}, indent=1)
+    _write_json(out_root / SEARCH_INDEX_NAME, {"version": 1, "terms": postings}, separators=(",", ":"))
+
+
+def find_samples(root: pathlib.Path) -> list[pathlib.Path]:
+    """Every file under `root` with a registered language plugin."""
+    return [fp for fp in root.rglob("*") if fp.suffix.lower() in LANGUAGES and fp.is_file()]
+
+
+def build_doc(sample: pathlib.Path, in_root: pathlib.Path, out_root: pathlib.Path,
+              entry: dict | None = None) -> dict:
+    """Convert one sample (any registered language) into its .md doc.
+
+    `entry` is the sample's previous manifest record; when the source hash,
+    template version and output still match it the build is skipped.
+    Returns the new record.
+    """
+    key = sample_key(sample, in_root)
+    with telemetry.span("read", key):
+        raw = sample.read_bytes()
+    source_hash = _sha(raw)
+    if entry and entry.get("source_hash") == source_hash and entry.get("template") == TEMPLATE_VERSION:
+        out = entry.get("output") and out_root / entry["output"]
+        if out is None or (out.exists() and _output_hash(out.read_text(encoding="utf-8")) == entry["output_hash"]):
+            print(f"up-to-date {out or sample}")
+            return entry
+
+    with telemetry.span("parse", key):
+        model = parse_sample(raw.decode("utf-8"), language_for(sample) or PYTHON)
+    return write_doc(sample, in_root, out_root, model, source_hash)
+
+
+def write_doc(sample: pathlib.Path, in_root: pathlib.Path, out_root: pathlib.Path,
+              model: SampleModel, source_hash: str) -> dict:
+    """Render an already parsed sample and write its doc unless only the timestamp changed.
+
+    Returns the sample's manifest record.
+    """
+    key = sample_key(sample, in_root)
+    meta = model.meta
+    if "title" not in meta:
+        print(f"‑ Skipping {sample} (no DOC_TITLE)")
+        return {"source_hash": source_hash, "template": TEMPLATE_VERSION, "output": None}
+
+    with telemetry.span("render", key):
+        md = render_doc(model, key)
+
+    # flat docs/ folder; other languages keep their extension so hello.py and hello.js don't collide
+    name = f"{sample.stem}.md" if model.language is PYTHON else f"{sample.name}.md"
+    dst = out_root / name
+    new_entry = {"source_hash": source_hash, "template": TEMPLATE_VERSION,
+                 "output": name, "output_hash": _output_hash(md), "links": meta["links"],
+                 "index": index_fields(model)}
+    with telemetry.span("write", key) as span:
+        previous = dst.read_text(encoding="utf-8") if dst.exists() else None
+        span["skipped"] = previous is not None and _output_hash(previous) == new_entry["output_hash"]
+        if not span["skipped"]:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.write_text(md, encoding="utf-8")
+    if span["skipped"]:
+        print(f"unchanged {dst}")                      # keep the old timestamp, no diff
+        return new_entry
+    print(f"{'updated' if previous is not None else 'created'} {dst}")
+    return new_entry
+
+
+def _build_task(task: tuple[pathlib.Path, pathlib.Path, pathlib.Path, dict | None]) -> tuple[dict | None, str, list[dict]]:
+    """Run build_doc with its output and telemetry captured.
+
+    Returns (manifest entry or None on failure, log, telemetry events).
+    """
+    fp, in_root, out_root, entry = task
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log), telemetry.capture() as events:
+        try:
+            entry = build_doc(fp, in_root, out_root, entry)
+        except Exception as exc:
+            print(f"Failed on {fp}: {exc}")
+            entry = None
+    return entry, log.getvalue(), events
+
+
+# Watch mode: poll the input tree and rebuild only what changed
+
+class DocWatcher:
+    """Poll `in_root` for changed samples and re-render just their docs.
+
+    Changes are spotted by (mtime, size); a save that does not change the bytes
+    then costs one hash, compared with the manifest's source hash. Real edits
+    are parsed and written through write_doc(), exactly like a batch build.
+    """
+
+    def __init__(self, in_root: pathlib.Path, out_root: pathlib.Path, docs: dict[str, dict],
+                 checker: LinkChecker | None = None, interval: float = 0.25, debounce: float = 0.2):
+        self.in_root, self.out_root, self.docs = in_root, out_root, docs
+        self.checker, self.interval, self.debounce = checker, interval, debounce
+        self.stats: dict[str, tuple[int, int]] = {}                 # path -> (mtime_ns, size)
+
+    def scan(self) -> dict[str, tuple[int, int]]:
+        found = {}
+        for fp in find_samples(self.in_root):
+            try:
+                st = fp.stat()
+            except FileNotFoundError:                               # deleted mid-scan
+                continue
+            found[sample_key(fp, self.in_root)] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def changes(self) -> set[str]:
+        """Paths added, modified or removed since the previous scan."""
+        current = self.scan()
+        changed = {k for k in current.keys() | self.stats.keys() if current.get(k) != self.stats.get(k)}
+        self.stats = current
+        return changed
+
+    def prime(self) -> None:
+        """Take the initial snapshot; the manifest already holds every sample's source hash."""
+        self.stats = self.scan()
+
+    def settle(self, changed: set[str]) -> set[str]:
+        """Debounce: keep collecting changes until none arrive for `debounce` seconds."""
+        quiet_since = time.monotonic()
+        while time.monotonic() - quiet_since < self.debounce:
+            time.sleep(min(self.interval, self.debounce))
+            if more := self.changes():
+                changed |= more
+                quiet_since = time.monotonic()
+        return changed
+
+    def rebuild(self, keys: set[str]) -> list[str]:
+        """Re-render the docs of `keys`; returns the paths whose docs were (re)written or removed."""
+        rebuilt = []
+        with telemetry.capture():                                   # don't accumulate events forever
+            for key in sorted(keys):
+                fp = self.in_root / key
+                if not fp.exists():
+                    if key in self.docs:
+                        prune_doc(self.out_root, key, self.docs.pop(key))
+                        rebuilt.append(key)
+                    continue
+                try:
+                    raw = fp.read_bytes()
+                    source_hash = _sha(raw)
+                    if self.docs.get(key, {}).get("source_hash") == source_hash:
+                        continue                                    # touched, not edited
+                    model = parse_sample(raw.decode("utf-8"), language_for(key))
+                    self.docs[key] = write_doc(fp, self.in_root, self.out_root, model, source_hash)
+                    rebuilt.append(key)
+                except Exception as exc:
+                    print(f"Failed on {fp}: {exc}")
+        if rebuilt:
+            save_manifest(self.out_root, self.docs)
+            try:
+                write_site_index(self.out_root, self.docs)
+            except OSError as exc:
+                print(f"Warning: could not write the site index: {exc}")
+        return rebuilt
+
+    def run(self) -> None:
+        self.prime()
+        print(f"Watching {self.in_root} for changes (Ctrl-C to stop)")
+        try:
+            while True:
+                if changed := self.changes():
+                    changed = self.settle(changed)
+                    start = time.perf_counter()
+                    rebuilt = self.rebuild(changed)
+                    if rebuilt:
+                        print(f"rebuilt {len(rebuilt)} doc(s) in {(time.perf_counter() - start) * 1000:.0f}ms")
+                        if self.checker:
+                            report_links({k: self.docs[k].get("links", []) for k in rebuilt if k in self.docs},
+                                         self.checker)
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description= "Generate docs from commented samples")
-    ap.add_argument("files", nargs="*", help="Specific .py files to process")
-    ap.add_argument("--list-file", help="Text file of .py paths (one per line)")
+    ap.add_argument("files", nargs="*", help="Specific sample files to process")
+    ap.add_argument("--list-file", help="Text file of sample paths (one per line)")
     ap.add_argument("--input-root", default="samples", help="Sample root dir")
     ap.add_argument("--output-root", default="docs", help="Docs output dir")
+    ap.add_argument("--force", action="store_true", help="Rebuild every doc, ignoring the build manifest")
+    ap.add_argument("--report", default=os.environ.get("AUTODOCS_DOCS_REPORT"),
+                    help="Write a run report (.json, or .jsonl for one event per line)")
+    ap.add_argument("--jobs", "-j", type=int, default=1,
+                    help="Build docs in N worker processes (0 = one per CPU core)")
+    ap.add_argument("--check-links-only", action="store_true",
+                    help="Only validate DOC_LINKS of the selected samples; exit 1 if any are broken")
+    ap.add_argument("--no-link-check", action="store_true", help="Skip link validation")
+    ap.add_argument("--link-cache", default=os.environ.get("AUTODOCS_LINK_CACHE"),
+                    help="JSON file caching link results between runs")
+    ap.add_argument("--link-cache-ttl", type=float, default=24, help="Hours a cached link result stays valid")
+    ap.add_argument("--link-workers", type=int, default=16, help="Concurrent link checks")
+    ap.add_argument("--link-per-host", type=int, default=4, help="Concurrent link checks per host")
+    ap.add_argument("--watch", action="store_true",
+                    help="After building, keep running and rebuild docs as samples under --input-root change")
+    ap.add_argument("--poll-interval", type=float, default=0.25, help="Seconds between --watch scans")
+    ap.add_argument("--debounce", type=float, default=0.2,
+                    help="Seconds of quiet to wait for after a change before rebuilding (--watch)")
     args = ap.parse_args()
     in_root  = pathlib.Path(args.input_root)
     out_root = pathlib.Path(args.output_root)
@@ -244,17 +638,79 @@ def main() -> None:
             for p in pathlib.Path(args.list_file).read_text().splitlines()
             if p.strip()]
     paths += [pathlib.Path(p) for p in args.files]
-    if not paths:
-        paths = list(in_root.rglob("*.py"))
+    full_build = not paths
+    if full_build:
+        paths = find_samples(in_root)
+    else:
+        for fp in paths:
+            if not language_for(fp):
+                print(f"‑ Skipping {fp} (no parser for {fp.suffix or 'files without an extension'})")
+        paths = [fp for fp in paths if language_for(fp)]
 
-    if not paths:
-        print("No Python files to process."); sys.exit(0)
+    checker = LinkChecker(pathlib.Path(args.link_cache).expanduser() if args.link_cache else None,
+                          ttl=args.link_cache_ttl * 3600, workers=args.link_workers, per_host=args.link_per_host)
+    if args.check_links_only:
+        links = {fp.as_posix(): parse_sample(fp.read_text(encoding="utf-8"), language_for(fp)).meta["links"]
+                 for fp in paths if fp.exists()}
+        sys.exit(1 if report_links(links, checker) else 0)
 
-    for fp in paths:
-        try:
-            build_doc(fp, in_root, out_root)
-        except Exception as exc:
-            print(f"Failed on {fp}: {exc}")
+    manifest, current = load_manifest(out_root, in_root)      # kept under --force for the docs not rebuilt
+    docs = dict(manifest)
+
+    # Prune docs whose sources were deleted (listed explicitly, or gone from a full build)
+    keys = {fp: sample_key(fp, in_root) for fp in paths}
+    existing = {keys[fp] for fp in paths if fp.exists()}
+    for key, entry in manifest.items():
+        if key not in existing and (full_build or key in keys.values()):
+            prune_doc(out_root, key, entry)
+            del docs[key]
+    paths = [fp for fp in paths if fp.exists()]
+
+    if not paths and docs == manifest and not args.watch:
+        print("No sample files to process."); sys.exit(0)
+
+    tasks = [(fp, in_root, out_root, None if args.force else manifest.get(keys[fp])) for fp in paths]
+    jobs = min(args.jobs or os.cpu_count() or 1, len(tasks))
+    failures = 0
+    with contextlib.ExitStack() as stack:
+        if jobs > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=jobs))
+            # a few chunks per worker balances uneven samples against IPC overhead
+            results = pool.map(_build_task, tasks, chunksize=max(1, len(tasks) // (jobs * 4)))
+        else:
+            results = map(_build_task, tasks)
+        for fp, (entry, log, events) in zip(paths, results):   # map() keeps input order, so logs are deterministic
+            print(log, end="")
+            telemetry.extend(events)
+            if entry is None:
+                failures += 1
+            else:
+                docs[keys[fp]] = entry
+
+    if docs != manifest or not current:
+        save_manifest(out_root, docs)
+    if docs != manifest or not (out_root / SEARCH_INDEX_NAME).exists():
+        with telemetry.span("index"):
+            try:
+                write_site_index(out_root, docs)
+            except OSError as exc:                   # the docs themselves are already written
+                print(f"Warning: could not write the site index: {exc}")
+
+    # Links of every doc re-rendered this run are checked together, so shared URLs are fetched once;
+    # up-to-date docs are left to --check-links-only, so a no-op build stays off the network
+    if not args.no_link_check:
+        rebuilt = {keys[fp] for fp in paths
+                   if keys[fp] in docs and (args.force or docs[keys[fp]] != manifest.get(keys[fp]))}
+        with telemetry.span("link_check"):
+            report_links({key: docs[key].get("links", []) for key in sorted(rebuilt)}, checker)
+
+    telemetry.finish(args.report)
+    if args.watch:
+        DocWatcher(in_root, out_root, docs, None if args.no_link_check else checker,
+                   args.poll_interval, args.debounce).run()
+    if failures:
+        print(f"{failures} of {len(paths)} doc(s) failed to build.")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
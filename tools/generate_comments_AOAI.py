@@ -1,20 +1,68 @@
-import os, sys, pathlib
-from azure.identity import DefaultAzureCredential
-from openai import AzureOpenAI # pip install openai>=1.14.0
-
-#  Azure client setup 
-endpoint = os.environ["AZURE_OPENAI_ENDPOINT"].rstrip("/") + "/"
-deployment_name = os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"]
-api_version = "2024-12-01-preview"      
-
-cred  = DefaultAzureCredential()
-token = lambda: cred.get_token("https://cognitiveservices.azure.com/.default").token
-
-client = AzureOpenAI(
-    azure_endpoint          = endpoint,
-    api_version             = api_version,
-    azure_ad_token_provider = token,   # <- bearer token obtained on each call
-)
+import os, sys, pathlib, argparse, ast, contextvars, hashlib, io, json, random, re, subprocess, tempfile, threading, time, tokenize
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+from telemetry import Telemetry
+from languages import PYTHON, Language, language_for
+
+#  Azure client setup
+#  openai / azure.identity imports, credential probing and the client itself are
+#  deferred to get_client(), so --help, usage errors and empty runs start instantly.
+BACKEND = os.environ.get("AUTODOCS_BACKEND", "azure")   # azure | openai | stub | replay; replaced in main()
+deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME", "")
+api_version = "2024-12-01-preview"
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+
+
+class CachedTokenProvider:
+    """Bearer-token callable that reuses one Entra token until shortly before it expires."""
+
+    def __init__(self, credential, scope: str = TOKEN_SCOPE, margin: float = 300):
+        self.credential, self.scope, self.margin = credential, scope, margin
+        self._token = None
+        self._lock  = threading.Lock()
+
+    def __call__(self) -> str:
+        with self._lock:
+            if self._token is None or self._token.expires_on - self.margin <= time.time():
+                self._token = self.credential.get_token(self.scope)
+            return self._token.token
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Build the AzureOpenAI client on first use and return the shared instance."""
+    global _client
+    with _client_lock:
+        if _client is None and BACKEND in ("openai", "stub"):   # any OpenAI-compatible server
+            from openai import OpenAI
+            _client = OpenAI(
+                base_url    = os.environ["OPENAI_BASE_URL"],
+                api_key     = os.environ.get("OPENAI_API_KEY") or "unused",
+                max_retries = 0,                   # retries are handled by _complete()
+            )
+        if _client is None:
+            from openai import AzureOpenAI # pip install openai>=1.14.0
+            endpoint = os.environ["AZURE_OPENAI_ENDPOINT"].rstrip("/") + "/"
+            if not deployment_name:
+                raise KeyError("AZURE_OPENAI_DEPLOYMENT_NAME")
+            if os.environ.get("AZURE_OPENAI_API_KEY"):   # key auth, e.g. for a local stub (tools/aoai_stub.py)
+                _client = AzureOpenAI(
+                    azure_endpoint = endpoint,
+                    api_version    = api_version,
+                    api_key        = os.environ["AZURE_OPENAI_API_KEY"],
+                    max_retries    = 0,            # retries are handled by _complete()
+                )
+            else:
+                from azure.identity import DefaultAzureCredential
+                _client = AzureOpenAI(
+                    azure_endpoint          = endpoint,
+                    api_version             = api_version,
+                    azure_ad_token_provider = CachedTokenProvider(DefaultAzureCredential()),
+                    max_retries             = 0,       # retries are handled by _complete()
+                )
+        return _client
 
 
 # Prompt template
@@ -81,40 +129,1010 @@ SYSTEM_PROMPT = (
     "• Absolutely no ``` fences, HTML, or extra wrappers.\n"
 )
 
-def annotate_source(code: str) -> str:
-    """Call the Azure OpenAI deployment and return the commented code."""
-    response = client.chat.completions.create(
-        model = deployment_name,    
-        messages  = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user",   "content": code},
+# Rate limiting
+class TokenBucket:
+    """Thread-safe token bucket refilled at `per_minute / 60` units per second.
+
+    Azure OpenAI evaluates RPM/TPM quotas over 10-second windows, so the burst
+    capacity is a sixth of the per-minute budget rather than the whole minute.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(per_minute / 6.0, 1.0)
+        self.rate     = per_minute / 60.0
+        self.level    = self.capacity
+        self.stamp    = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def take(self, amount: float) -> None:
+        """Block until `amount` units are available, then consume them."""
+        amount = min(amount, self.capacity)   # oversized requests wait for a full bucket
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+            time.sleep(wait)
+
+
+class Scheduler:
+    """Caps in-flight requests and paces them against the deployment's RPM/TPM quota."""
+
+    def __init__(self, concurrency: int = 1, rpm: float = 0, tpm: float = 0, max_retries: int = 5):
+        self.slots       = threading.BoundedSemaphore(max(concurrency, 1))
+        self.requests    = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens      = TokenBucket(tpm) if tpm > 0 else None
+        self.max_retries = max_retries
+
+    def acquire(self, tokens: int) -> None:
+        self.slots.acquire()
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+
+    def release(self) -> None:
+        self.slots.release()
+
+
+scheduler = Scheduler()    # replaced in main() from the CLI options
+
+
+# Response cache
+class AnnotationCache:
+    """On-disk, content-addressed store of completions with size-bounded LRU eviction.
+
+    Entries are keyed by a hash of the full request (messages, deployment and
+    sampling parameters); a hit refreshes the entry's mtime, which is the LRU clock.
+    """
+
+    def __init__(self, root: pathlib.Path, max_bytes: int):
+        self.root      = root
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(payload: dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            text = path.read_text(encoding="utf-8")
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+
+    def evict(self) -> int:
+        """Delete least-recently-used entries until the cache fits in max_bytes; return the count removed."""
+        entries = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.root.glob("??/*") if p.is_file()]
+        total   = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total   -= size
+            removed += 1
+        return removed
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = f" ({100 * self.hits / lookups:.0f}% hit rate)" if lookups else ""
+        return f"Cache: {self.hits} hit(s), {self.misses} miss(es){rate}"
+
+
+cache: AnnotationCache | None = None    # enabled in main() with --cache-dir
+
+
+# Telemetry: spans and token usage are attributed to the file being processed
+telemetry    = Telemetry("commenter")     # replaced in main() with pricing from the CLI
+current_file: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_file", default=None)
+# Extra system-prompt text and attempt number for a file being re-sent after its output failed validation
+retry_note: contextvars.ContextVar[str] = contextvars.ContextVar("retry_note", default="")
+retry_attempt: contextvars.ContextVar[int] = contextvars.ContextVar("retry_attempt", default=0)
+# (cache key, completion) pairs held back until the file's result passes verification; None caches at once
+unverified: contextvars.ContextVar[list | None] = contextvars.ContextVar("unverified", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for TPM pacing."""
+    return len(text) // 4 + 1
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: honour Retry-After, else exponential backoff with jitter."""
+    response = getattr(exc, "response", None)
+    if response is not None:
+        headers = response.headers
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            pass    # HTTP-date form; fall through to backoff
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    openai = sys.modules.get("openai")   # loaded by get_client(); never loaded when replaying
+    if openai is None:
+        return False
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):   # includes timeouts
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+# LLM backends: live client, recorder and replayer behind one complete() call
+class Completion(NamedTuple):
+    content: str
+    finish_reason: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class ClientBackend:
+    """Chat completions through get_client(): Azure OpenAI, or an OpenAI-compatible server."""
+
+    def complete(self, messages: list[dict], max_tokens: int, temperature: float) -> Completion:
+        response = get_client().chat.completions.create(
+            model       = deployment_name,
+            messages    = messages,
+            temperature = temperature,
+            max_tokens  = max_tokens,
+        )
+        choice, usage = response.choices[0], response.usage
+        return Completion(choice.message.content, choice.finish_reason,
+                          usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0)
+
+
+def _recording_key(messages: list[dict], max_tokens: int, temperature: float) -> str:
+    # the deployment name is left out so recordings replay against any deployment (or none)
+    return AnnotationCache.key({"messages": messages, "temperature": temperature, "max_tokens": max_tokens})
+
+
+class RecordingBackend:
+    """Forward requests to `inner` and store each response in `root` under its request hash."""
+
+    def __init__(self, inner, root: pathlib.Path):
+        self.inner, self.root = inner, root
+        root.mkdir(parents=True, exist_ok=True)
+
+    def complete(self, messages: list[dict], max_tokens: int, temperature: float) -> Completion:
+        result = self.inner.complete(messages, max_tokens, temperature)
+        self.record(messages, max_tokens, temperature, result)
+        return result
+
+    def record(self, messages: list[dict], max_tokens: int, temperature: float, result: Completion) -> None:
+        """Store `result` as the response to this request (also used for annotation-cache hits)."""
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump({"request": {"messages": messages, "max_tokens": max_tokens, "temperature": temperature},
+                       "response": result._asdict()}, fh, indent=1, sort_keys=True)
+        os.replace(tmp, self.root / f"{_recording_key(messages, max_tokens, temperature)}.json")
+
+
+class ReplayBackend:
+    """Answer requests from a RecordingBackend directory only; an unrecorded request is an error."""
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+
+    def complete(self, messages: list[dict], max_tokens: int, temperature: float) -> Completion:
+        key = _recording_key(messages, max_tokens, temperature)
+        try:
+            data = json.loads((self.root / f"{key}.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise LookupError(f"no recorded response for request {key[:12]} in {self.root}") from None
+        return Completion(**data["response"])
+
+
+backend = ClientBackend()    # replaced in main() from --backend / --recordings
+
+
+def _cache_verified(pending: list[tuple[str, str]]) -> None:
+    """Store the completions behind a result that passed verification."""
+    if cache:
+        for key, text in pending:
+            cache.put(key, text)
+
+
+def _endpoint() -> str:
+    """Server the live backend talks to, so caches never mix answers from different servers."""
+    name = "AZURE_OPENAI_ENDPOINT" if BACKEND == "azure" else "OPENAI_BASE_URL"
+    return os.environ.get(name, "").rstrip("/")
+
+
+def _complete(messages: list[dict], max_tokens: int, temperature: float = 0.3) -> str:
+    """Send one chat-completion request through the scheduler, retrying 429/5xx responses."""
+    if cache:
+        key = cache.key({"backend": BACKEND, "endpoint": _endpoint(), "model": deployment_name,
+                         "messages": messages, "temperature": temperature, "max_tokens": max_tokens})
+        if (hit := cache.get(key)) is not None:
+            telemetry.usage(current_file.get(), 0, 0, cached=True)
+            if isinstance(backend, RecordingBackend):     # keep the recording complete for --backend replay
+                backend.record(messages, max_tokens, temperature, Completion(hit, "stop"))
+            return hit
+    # Azure counts prompt tokens plus max_tokens against the TPM quota
+    cost = sum(estimate_tokens(m["content"]) for m in messages) + max_tokens
+    for attempt in range(scheduler.max_retries + 1):
+        scheduler.acquire(cost)
+        try:
+            with telemetry.span("llm", current_file.get(), attempt=attempt):
+                result = backend.complete(messages, max_tokens, temperature)
+            if result.prompt_tokens or result.completion_tokens:
+                telemetry.usage(current_file.get(), result.prompt_tokens, result.completion_tokens)
+            if result.finish_reason == "length":
+                raise ValueError(f"output truncated at max_tokens={max_tokens}")
+            if cache and result.finish_reason == "stop":
+                if (pending := unverified.get()) is None:
+                    cache.put(key, result.content)
+                else:
+                    pending.append((key, result.content))
+            return result.content
+        except Exception as exc:
+            if attempt == scheduler.max_retries or not _is_retryable(exc):
+                raise
+            delay = _retry_delay(exc, attempt)
+            print(f"  retrying in {delay:.1f}s after: {exc.__class__.__name__}")
+        finally:
+            scheduler.release()
+        time.sleep(delay)
+
+
+# Chunking
+CHUNK_LINES = 150    # files longer than this are split; replaced in main() from --chunk-lines
+MAX_OUTPUT_TOKENS = 16384   # the deployment's completion limit; replaced in main() from --max-output-tokens
+
+FRAGMENT_PROMPT = (
+    "\n\nFRAGMENT MODE:\n"
+    "• The user message is one fragment of a larger module; other fragments are annotated separately.\n"
+    "• Return the fragment with comments added. Keep every code line, in order, exactly as given.\n"
+    "• Do not add or change imports, definitions or docstrings that are not in the fragment.\n"
+)
+FIRST_FRAGMENT_PROMPT = (
+    "• This is the first fragment: emit the file-level `# DOC_TITLE` / `# DOC_SUMMARY` / `# DOC_NOTE` / "
+    "`# DOC_LINKS` lines for the whole module at the top. The module outline is:\n{outline}\n"
+)
+LATER_FRAGMENT_PROMPT = (
+    "• This is NOT the first fragment: do not emit file-level `# DOC_TITLE`, `# DOC_SUMMARY`, `# DOC_NOTE` "
+    "or `# DOC_LINKS` lines (`### Step` headings and `# DOC_STEP_SUMMARY` lines are still expected).\n"
+)
+FILE_META_RE = re.compile(r"^#\s*DOC_(TITLE|SUMMARY|BLURB|NOTES?|LINKS?):", re.I)
+
+
+def check_tokenizes(code: str, lang: Language = PYTHON) -> list:
+    """Return `code`'s comment-free tokens, or raise ValueError: such a file can never be verified."""
+    try:
+        return lang.code_tokens(code)
+    except (SyntaxError, tokenize.TokenError) as exc:
+        raise ValueError(f"source does not tokenize, refusing to rewrite it: {exc}") from None
+
+
+def verify_annotation(original: str, annotated: str, lang: Language = PYTHON) -> None:
+    """Raise ValueError unless `annotated` only differs from `original` in comments.
+
+    `annotated` must also parse, unless `original` itself does not (Python 2,
+    syntax newer than this interpreter); then the token streams alone decide.
+    """
+    expected = check_tokenizes(original, lang)
+    try:
+        lang.check_syntax(original)
+    except SyntaxError:
+        parses = False
+    else:
+        parses = True
+    try:
+        if parses:
+            lang.check_syntax(annotated)
+        same = lang.code_tokens(annotated) == expected
+    except (SyntaxError, tokenize.TokenError) as exc:
+        raise ValueError(f"annotated output does not parse: {exc}") from None
+    if not same:
+        raise ValueError("annotated output changed code, not just comments")
+
+
+FENCE_RE = re.compile(r"^[ \t]*```[\w+.-]*[ \t]*\n(.*?)^[ \t]*```[ \t]*$", re.M | re.S)
+
+
+def strip_fences(text: str, lang: Language = PYTHON) -> str:
+    """Unwrap output the model put in a single ``` fence (dropping prose around it) despite the prompt.
+
+    Python that already parses is returned unchanged, so fences inside docstrings
+    are safe; for languages without a parser the text must begin or end with a fence.
+    """
+    if lang is PYTHON:
+        try:
+            ast.parse(text)
+            return text
+        except SyntaxError:
+            pass
+    else:
+        edges = text.strip().splitlines() or [""]
+        if not (edges[0].lstrip().startswith("```") or edges[-1].lstrip().startswith("```")):
+            return text
+    fences = list(FENCE_RE.finditer(text))
+    return fences[0].group(1) if len(fences) == 1 else text
+
+
+def keep_trailing_newlines(result: str, original: str) -> str:
+    """Give `result` exactly the trailing newlines of `original` (models often drop or add one)."""
+    return result.rstrip("\n") + original[len(original.rstrip("\n")):]
+
+
+def write_atomic(path: pathlib.Path, text: str) -> None:
+    """Replace `path` via a temp file in the same directory, so an interrupted run never leaves half a file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as fh:
+            fh.write(text)
+        os.chmod(tmp, path.stat().st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def split_chunks(code: str, max_lines: int) -> list[str]:
+    """Split a module on top-level def/class/`### Step` boundaries into chunks of at most ~max_lines.
+
+    Comment lines directly above a definition stay with it, so a `### Step`
+    heading and its DOC_STEP_SUMMARY travel with the code they describe.
+    Returns [code] unchanged when the file is short or does not parse.
+    """
+    lines = code.splitlines(keepends=True)
+    if len(lines) <= max_lines:
+        return [code]
+    try:
+        tree = ast.parse(code)
+        comments = {tok.start[0]: tok for tok in tokenize.generate_tokens(io.StringIO(code).readline)
+                    if tok.type == tokenize.COMMENT and not tok.line[:tok.start[1]].strip()}   # comment-only lines
+    except (SyntaxError, tokenize.TokenError):
+        return [code]
+
+    inside: set[int] = set()          # 1-based lines covered by a top-level statement
+    starts: set[int] = set()
+    for node in tree.body:
+        first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        inside.update(range(first + 1, node.end_lineno + 1))
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            while first - 1 in comments and first - 1 not in inside:   # pull leading comments along
+                first -= 1
+            starts.add(first)
+    starts.update(n for n, tok in comments.items()
+                  if tok.start[1] == 0 and tok.string.startswith("###") and n not in inside)
+
+    bounds = sorted(b - 1 for b in starts if b > 1) + [len(lines)]
+    chunks: list[str] = []
+    begin = 0
+    for prev, end in zip([0] + bounds, bounds):
+        # close the current chunk when adding the next segment would overflow it
+        if end - begin > max_lines and prev > begin:
+            chunks.append("".join(lines[begin:prev]))
+            begin = prev
+    chunks.append("".join(lines[begin:]))
+    return chunks
+
+
+def _outline(code: str) -> str:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return "  (unavailable)"
+    names = [f"  {type(n).__name__.replace('Def', '').lower()} {n.name}" for n in tree.body
+             if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+    steps = [f"  {ln.strip()}" for ln in code.splitlines() if ln.startswith("###")]
+    return "\n".join(steps + names) or "  (no top-level definitions)"
+
+
+def _max_tokens(code: str) -> int:
+    """Completion budget: the code echoed back plus room for comments and metadata.
+
+    Doubled on each retry, but never above MAX_OUTPUT_TOKENS, which the deployment would reject.
+    """
+    return min(max(1000, 2 * estimate_tokens(code) + 400) * 2 ** retry_attempt.get(), MAX_OUTPUT_TOKENS)
+
+
+def _annotate_chunk(chunk: str, index: int, outline: str) -> str:
+    extra = FIRST_FRAGMENT_PROMPT.format(outline=outline) if index == 0 else LATER_FRAGMENT_PROMPT
+    result = _complete(
+        messages   = [
+            {"role": "system", "content": SYSTEM_PROMPT + FRAGMENT_PROMPT + extra + retry_note.get()},
+            {"role": "user",   "content": chunk},
         ],
-        temperature = 0.3,
-        max_tokens  = 1000,
+        max_tokens = _max_tokens(chunk),
     )
-    return response.choices[0].message.content
+    result = strip_fences(result)
+    if index:
+        result = "".join(ln for ln in result.splitlines(keepends=True) if not FILE_META_RE.match(ln))
+    return result if result.endswith("\n") else result + "\n"
+
+
+LANGUAGE_PROMPT = (
+    "\n\nLANGUAGE:\n"
+    "• This file is {name}, not Python: apply every rule above to {name} instead.\n"
+    "• Write comments and metadata with `{c}` (e.g. `{c} DOC_TITLE: ...`, `{c} DOC_STEP_SUMMARY: ...`) and mark "
+    "steps with `{c} ### Step heading`.\n"
+    "• Output must be syntactically valid {name}.\n"
+)
+
+
+def _file_messages(code: str, lang: Language = PYTHON) -> list[dict]:
+    extra = "" if lang is PYTHON else LANGUAGE_PROMPT.format(name=lang.name, c=lang.line_comment)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + extra + retry_note.get()},
+        {"role": "user",   "content": code},
+    ]
+
+
+def annotate_source(code: str, lang: Language = PYTHON) -> str:
+    """Call the Azure OpenAI deployment and return the commented code.
+
+    Long Python files are annotated as concurrent chunks and stitched back
+    together (other languages are always sent whole); the result is rejected
+    (ValueError) if it no longer parses or changed code.
+    """
+    chunks = split_chunks(code, CHUNK_LINES) if lang is PYTHON else [code]
+    if len(chunks) == 1:
+        result = strip_fences(_complete(messages=_file_messages(code, lang), max_tokens=_max_tokens(code)), lang)
+        result = keep_trailing_newlines(result, code)
+    else:
+        outline = _outline(code)
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:   # the scheduler caps requests in flight
+            # each task runs in a copy of this context so its usage is attributed to the same file
+            futures = [pool.submit(contextvars.copy_context().run, _annotate_chunk, chunk, i, outline)
+                       for i, chunk in enumerate(chunks)]
+            parts = [f.result() for f in futures]
+        result = "".join(parts)
+        if not code.endswith("\n"):
+            result = result[:-1]
+    with telemetry.span("verify", current_file.get()):
+        verify_annotation(code, result, lang)
+    return result
+
+
+# Diff-aware re-annotation
+def git_baseline(repo_root: pathlib.Path, rev: str, rel_path: str) -> str | None:
+    """Content of `rel_path` at git revision `rev`, or None if it did not exist there."""
+    proc = subprocess.run(["git", "-C", str(repo_root), "show", f"{rev}:./{rel_path}"], capture_output=True)
+    return proc.stdout.decode("utf-8") if proc.returncode == 0 else None
+
+
+def _region_key(region: str, lang: Language = PYTHON) -> tuple | None:
+    try:
+        return tuple(lang.code_tokens(region))
+    except (tokenize.TokenError, SyntaxError):
+        return None                      # never matches, so the region is treated as changed
+
+
+def annotate_changes(code: str, baseline: str, lang: Language = PYTHON) -> str:
+    """Re-annotate only the top-level regions of `code` whose code differs from `baseline`.
+
+    Regions are the def/class/`### Step` segments from split_chunks(); a region
+    is unchanged when its comment-free token stream also appears in the
+    baseline. Unchanged regions keep their current text, and runs of changed
+    regions are sent (with the module outline as context) and spliced back.
+    Other languages are compared, and re-annotated, as whole files.
+    """
+    regions = split_chunks(code, 0) if lang is PYTHON else [code]
+    if len(regions) == 1:
+        return annotate_source(code, lang) if _region_key(code, lang) != _region_key(baseline, lang) else code
+    remaining: dict[tuple | None, int] = {}
+    for region in split_chunks(baseline, 0):
+        key = _region_key(region)
+        remaining[key] = remaining.get(key, 0) + 1
+    changed = []
+    for i, region in enumerate(regions):
+        key = _region_key(region)
+        if key is not None and remaining.get(key):
+            remaining[key] -= 1
+        else:
+            changed.append(i)
+    if not changed:
+        return code
+
+    runs: list[list[int]] = []            # adjacent changed regions go out as one request
+    for i in changed:
+        if runs and runs[-1][-1] == i - 1:
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+    print(f"  re-annotating {len(changed)} of {len(regions)} region(s) in {len(runs)} request(s)")
+    outline = _outline(code)
+    with ThreadPoolExecutor(max_workers=len(runs)) as pool:
+        futures = {run[0]: pool.submit(contextvars.copy_context().run, _annotate_chunk,
+                                       "".join(regions[i] for i in run), run[0], outline) for run in runs}
+        replaced = {run[0]: (run, futures[run[0]].result()) for run in runs}
+    parts, i = [], 0
+    while i < len(regions):
+        if i in replaced:
+            run, text = replaced[i]
+            parts.append(text)
+            i = run[-1] + 1
+        else:
+            parts.append(regions[i])
+            i += 1
+    result = "".join(parts)
+    if not code.endswith("\n") and result.endswith("\n"):
+        result = result[:-1]
+    with telemetry.span("verify", current_file.get()):
+        verify_annotation(code, result)
+    return result
 
 
 # File IO helpers
-def process_file(rel_path: str, repo_root: pathlib.Path) -> None:
+VALIDATION_RETRIES = 2    # re-sends per file after rejected output; replaced in main() from --validation-retries
+
+RETRY_PROMPT = (
+    "\n\nRETRY {attempt} OF {retries}:\n"
+    "• Your previous answer for this code was rejected: {reason}.\n"
+    "• Return the code exactly as given – every line, in order, unchanged – adding only `{c}` comments "
+    "and `{c} DOC_` lines.\n"
+    "• Output raw {name} only: no ``` fences and no prose before or after the code.\n"
+)
+
+
+def process_file(rel_path: str, repo_root: pathlib.Path, baseline_rev: str | None = None) -> float:
+    """Comment one file in place and return the elapsed seconds.
+
+    With `baseline_rev`, only regions changed since that git revision are
+    re-annotated. Output that is truncated or fails verify_annotation() is
+    re-requested with a stricter prompt and a larger budget up to
+    VALIDATION_RETRIES times; the file is only ever replaced atomically with
+    a verified result, and only completions behind that result are cached.
+    """
+    started = time.perf_counter()
     file_path = repo_root / rel_path
+    lang = language_for(rel_path) or PYTHON
+    current_file.set(rel_path)
+    retry_attempt.set(0)
+    retry_note.set("")
     print("commenting", file_path)
-    original = file_path.read_text(encoding="utf-8")
-    commented = annotate_source(original)
-    file_path.write_text(commented, encoding="utf-8")
+    with telemetry.span("read", rel_path):
+        original = file_path.read_text(encoding="utf-8")
+    check_tokenizes(original, lang)                # no request for a file whose output could not be checked
+    baseline = git_baseline(repo_root, baseline_rev, rel_path) if baseline_rev else None
+    pending: list[tuple[str, str]] = []
+    unverified.set(pending)
+    for attempt in range(VALIDATION_RETRIES + 1):
+        try:
+            if baseline is not None:
+                commented = annotate_changes(original, baseline, lang)
+            else:
+                commented = annotate_source(original, lang)
+            break
+        except ValueError as exc:
+            pending.clear()                        # never cache output that was rejected
+            if attempt == VALIDATION_RETRIES:
+                raise
+            with telemetry.span("retry", rel_path, reason=str(exc)):
+                print(f"  {rel_path}: {exc}; retrying with a stricter prompt")
+                retry_attempt.set(attempt + 1)
+                retry_note.set(RETRY_PROMPT.format(reason=exc, c=lang.line_comment, name=lang.name,
+                                                   attempt=attempt + 1, retries=VALIDATION_RETRIES))
+    _cache_verified(pending)
+    if commented == original:
+        print(f"  {rel_path} unchanged; nothing to write")
+        return time.perf_counter() - started
+    with telemetry.span("write", rel_path):
+        write_atomic(file_path, commented)
+    return time.perf_counter() - started
+
+
+# Request packing: several small files share one request (and one copy of SYSTEM_PROMPT)
+PACK_PROMPT = (
+    "\n\nPACKED MODE:\n"
+    "• The user message holds several independent files. Each starts with a delimiter line of the form\n"
+    "  `# ===== AUTODOCS FILE <n>: <path> =====`.\n"
+    "• Return every file, in the same order, each preceded by its delimiter line copied exactly.\n"
+    "• Annotate each file on its own, with its own `# DOC_` metadata right after its delimiter.\n"
+)
+PACK_DELIM_RE = re.compile(r"^# ===== AUTODOCS FILE (\d+): .* =====[ \t]*\r?\n?", re.M)
+
+
+def pack_files(sizes: dict[str, int], threshold: int, budget: int) -> tuple[list[list[str]], list[str]]:
+    """Group files of at most `threshold` estimated tokens into packs of at most `budget` tokens.
+
+    Returns (packs, files to send on their own); a pack of one is sent on its own.
+    """
+    packs: list[list[str]] = []
+    alone, used = [], budget
+    for rel, tokens in sorted(sizes.items(), key=lambda kv: kv[1]):   # similar sizes pack together
+        if tokens > threshold:
+            alone.append(rel)
+            continue
+        if used + tokens > budget:
+            packs.append([])
+            used = 0
+        packs[-1].append(rel)
+        used += tokens
+    alone += [p[0] for p in packs if len(p) == 1]
+    return [p for p in packs if len(p) > 1], alone
+
+
+def _pack_messages(codes: dict[str, str]) -> list[dict]:
+    body = []
+    for i, (rel, code) in enumerate(codes.items(), 1):
+        body += [f"# ===== AUTODOCS FILE {i}: {rel} =====\n", code, "" if code.endswith("\n") else "\n"]
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + PACK_PROMPT},
+        {"role": "user",   "content": "".join(body)},
+    ]
+
+
+def split_pack(text: str, count: int) -> dict[int, str]:
+    """Split a packed response into {file number: annotated text}; numbers seen twice are dropped."""
+    marks = list(PACK_DELIM_RE.finditer(text))
+    parts: dict[int, str] = {}
+    seen: set[int] = set()
+    for mark, nxt in zip(marks, marks[1:] + [None]):
+        n = int(mark.group(1))
+        if n in seen:
+            parts.pop(n, None)
+        elif 1 <= n <= count:
+            parts[n] = text[mark.end():nxt.start() if nxt else len(text)]
+        seen.add(n)
+    return parts
+
+
+def process_pack(rel_paths: list[str], repo_root: pathlib.Path) -> list[str]:
+    """Annotate several small files with one request; return the files that must be retried on their own.
+
+    Each file's part of the response is checked like a single-file result, so
+    one bad file never blocks the rest of its pack. Raises if the request fails.
+    """
+    current_file.set(None)                         # the shared request is counted in run totals only
+    pending: list[tuple[str, str]] = []
+    unverified.set(pending)
+    originals = {}
+    for rel in rel_paths:
+        with telemetry.span("read", rel):
+            originals[rel] = (repo_root / rel).read_text(encoding="utf-8")
+    print(f"commenting pack of {len(rel_paths)}: {', '.join(rel_paths)}")
+    text = _complete(messages=_pack_messages(originals),
+                     max_tokens=min(max(1000, sum(2 * estimate_tokens(c) + 400 for c in originals.values())),
+                                    MAX_OUTPUT_TOKENS))
+    parts = split_pack(strip_fences(text), len(rel_paths))
+    retry = []
+    for n, (rel, original) in enumerate(originals.items(), 1):
+        current_file.set(rel)
+        commented = parts.get(n)
+        try:
+            if commented is None:
+                raise ValueError("missing from the packed response")
+            commented = keep_trailing_newlines(strip_fences(commented), original)
+            with telemetry.span("verify", rel):
+                verify_annotation(original, commented)
+        except ValueError as exc:
+            print(f"  {rel}: {exc}; retrying on its own")
+            retry.append(rel)
+            continue
+        if commented != original:
+            with telemetry.span("write", rel):
+                write_atomic(repo_root / rel, commented)
+    if not retry:
+        _cache_verified(pending)                   # a partly rejected pack would replay its rejects
+    return retry
+
+
+# Batch backfill
+BATCH_FAILED = {"failed", "expired", "cancelled"}
+
+
+def _load_state(path: pathlib.Path) -> dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"batches": {}, "files": {}}
 
-def main() -> None:
-    if len(sys.argv) != 3:
-        print("usage: generate_comments_AOAI.py <updated_files.txt> <repo_root>")
-        sys.exit(1)
 
-    updated_list = pathlib.Path(sys.argv[1])
-    repo_root    = pathlib.Path(sys.argv[2])
+def _save_state(path: pathlib.Path, state: dict) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        json.dump(state, fh, indent=1, sort_keys=True)
+    os.replace(tmp, path)
 
-    py_files = [ln.strip() for ln in updated_list.read_text().splitlines() if ln.strip().endswith(".py")]
-    print(f"Found {len(py_files)} Python file(s) to process.")
+
+def _needs_submit(entry: dict | None, source_hash: str, batches: dict) -> bool:
+    if entry is None:
+        return True
+    if entry["status"] == "applied":
+        return source_hash != entry["result_hash"]         # edited again after we annotated it
+    if entry["status"] == "submitted":
+        return source_hash != entry["source_hash"] or batches[entry["batch"]]["status"] in BATCH_FAILED
+    return source_hash != entry["source_hash"]              # failed/stale: retry only once the file changes
+
+
+def submit_backfill(py_files: list[str], repo_root: pathlib.Path, state: dict, state_path: pathlib.Path,
+                    batch_size: int, batch_deployment: str) -> int:
+    """Upload JSONL batch jobs for every file not already submitted or applied; return the request count."""
+    todo = []
     for rel in py_files:
-        process_file(rel, repo_root)
+        code = (repo_root / rel).read_text(encoding="utf-8")
+        source_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        if _needs_submit(state["files"].get(rel), source_hash, state["batches"]):
+            todo.append((rel, code, source_hash))
+
+    for start in range(0, len(todo), batch_size):
+        group = todo[start:start + batch_size]
+        lines, requests = [], {}
+        for rel, code, source_hash in group:
+            custom_id = hashlib.sha256(f"{rel}\0{source_hash}".encode("utf-8")).hexdigest()[:32]
+            requests[custom_id] = rel
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/chat/completions",
+                                     "body": {"model": batch_deployment,
+                                              "messages": _file_messages(code, language_for(rel) or PYTHON),
+                                              "temperature": 0.3, "max_tokens": _max_tokens(code)}}))
+        with telemetry.span("batch_submit", requests=len(group)):
+            upload = get_client().files.create(
+                file=("autodocs-backfill.jsonl", ("\n".join(lines) + "\n").encode("utf-8")), purpose="batch")
+            batch = get_client().batches.create(input_file_id=upload.id, endpoint="/chat/completions",
+                                                completion_window="24h")
+        state["batches"][batch.id] = {"status": batch.status, "input_file_id": upload.id,
+                                      "applied": False, "requests": requests}
+        for rel, _, source_hash in group:
+            state["files"][rel] = {"status": "submitted", "batch": batch.id, "source_hash": source_hash}
+        _save_state(state_path, state)         # persist before waiting so an interrupted run can resume
+        print(f"Submitted batch {batch.id} with {len(group)} request(s).")
+    return len(todo)
+
+
+def apply_batch(batch_id: str, batch, repo_root: pathlib.Path, state: dict) -> dict[str, int]:
+    """Write the results of a completed batch back to their files; return per-outcome counts."""
+    counts = {"applied": 0, "failed": 0, "stale": 0}
+    requests = state["batches"][batch_id]["requests"]
+    results = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            results += [json.loads(ln) for ln in get_client().files.content(file_id).text.splitlines() if ln.strip()]
+    seen = set()
+    for res in results:
+        rel = requests.get(res["custom_id"])
+        if rel is None:
+            continue
+        seen.add(res["custom_id"])
+        entry = state["files"][rel]
+        if entry["status"] != "submitted" or entry["batch"] != batch_id:
+            continue                                           # already applied or superseded
+        current_file.set(rel)
+        path = repo_root / rel
+        original = path.read_text(encoding="utf-8")
+        if hashlib.sha256(original.encode("utf-8")).hexdigest() != entry["source_hash"]:
+            entry["status"] = "stale"                          # edited while the batch ran
+            counts["stale"] += 1
+            continue
+        try:
+            response = res.get("response") or {}
+            if response.get("status_code") != 200:
+                raise ValueError(f"request failed: {res.get('error') or response.get('body')}")
+            body = response["body"]
+            if usage := body.get("usage"):
+                telemetry.usage(rel, usage["prompt_tokens"], usage["completion_tokens"])
+            if body["choices"][0].get("finish_reason") == "length":
+                raise ValueError("output truncated at max_tokens")
+            lang = language_for(rel) or PYTHON
+            commented = keep_trailing_newlines(strip_fences(body["choices"][0]["message"]["content"], lang), original)
+            with telemetry.span("verify", rel):
+                verify_annotation(original, commented, lang)
+            with telemetry.span("write", rel):
+                write_atomic(path, commented)
+        except (KeyError, ValueError) as exc:
+            entry.update(status="failed", error=str(exc))
+            counts["failed"] += 1
+            print(f"Failed on {rel}: {exc}")
+            continue
+        entry.update(status="applied", result_hash=hashlib.sha256(commented.encode("utf-8")).hexdigest())
+        counts["applied"] += 1
+    for custom_id, rel in requests.items():                    # requests the batch never answered
+        entry = state["files"][rel]
+        if custom_id not in seen and entry["status"] == "submitted" and entry["batch"] == batch_id:
+            entry.update(status="failed", error="no result in batch output")
+            counts["failed"] += 1
+    return counts
+
+
+def backfill(py_files: list[str], repo_root: pathlib.Path, state_path: pathlib.Path,
+             batch_size: int, poll_interval: float, batch_deployment: str) -> int:
+    """Annotate files through the Batch API, resuming from `state_path`; return the failure count.
+
+    Re-running with the same state file skips files that were already applied
+    and keeps waiting on batches submitted by an interrupted run.
+    """
+    state = _load_state(state_path)
+    submit_backfill(py_files, repo_root, state, state_path, batch_size, batch_deployment)
+    totals = {"applied": 0, "failed": 0, "stale": 0}
+    with telemetry.span("batch_wait"):
+        while True:
+            waiting = 0
+            for batch_id, info in state["batches"].items():
+                if info["applied"] or info["status"] in BATCH_FAILED:
+                    continue
+                batch = get_client().batches.retrieve(batch_id)
+                info["status"] = batch.status
+                if batch.status == "completed":
+                    for k, v in apply_batch(batch_id, batch, repo_root, state).items():
+                        totals[k] += v
+                    info["applied"] = True
+                    print(f"Applied batch {batch_id}.")
+                elif batch.status in BATCH_FAILED:
+                    print(f"Batch {batch_id} ended with status {batch.status}; its files will be resubmitted next run.")
+                else:
+                    waiting += 1
+                _save_state(state_path, state)
+            if not waiting:
+                break
+            print(f"Waiting on {waiting} batch job(s)...")
+            time.sleep(poll_interval)
+    print(f"Backfill: {totals['applied']} applied, {totals['failed']} failed, "
+          f"{totals['stale']} skipped (changed while the batch ran).")
+    return totals["failed"] + sum(info["status"] in BATCH_FAILED and not info["applied"]
+                                  for info in state["batches"].values())
+
+
+def main() -> None:
+    global scheduler, cache, telemetry, backend, deployment_name, BACKEND, CHUNK_LINES, VALIDATION_RETRIES
+    global MAX_OUTPUT_TOKENS
+    ap = argparse.ArgumentParser(description="Add inline comments to code samples with Azure OpenAI")
+    ap.add_argument("updated_list", help="Text file of changed paths (one per line)")
+    ap.add_argument("repo_root", help="Repository root the paths are relative to")
+    ap.add_argument("--backend", choices=("azure", "openai", "stub", "replay"), default=BACKEND,
+                    help="LLM backend: Azure OpenAI, an OpenAI-compatible server at $OPENAI_BASE_URL, "
+                         "the in-process stub (tools/aoai_stub.py), or recorded responses (env AUTODOCS_BACKEND)")
+    ap.add_argument("--recordings", default=os.environ.get("AUTODOCS_RECORDINGS"),
+                    help="Directory of responses keyed by request hash: written by live backends, "
+                         "read by --backend replay")
+    ap.add_argument("--concurrency", type=int, default=int(os.environ.get("AUTODOCS_CONCURRENCY", 4)),
+                    help="Maximum number of requests in flight")
+    ap.add_argument("--rpm", type=float, default=float(os.environ.get("AZURE_OPENAI_RPM", 0)),
+                    help="Deployment requests-per-minute quota (0 = unlimited)")
+    ap.add_argument("--tpm", type=float, default=float(os.environ.get("AZURE_OPENAI_TPM", 0)),
+                    help="Deployment tokens-per-minute quota (0 = unlimited)")
+    ap.add_argument("--max-retries", type=int, default=5, help="Retries per request on 429/5xx")
+    ap.add_argument("--chunk-lines", type=int, default=CHUNK_LINES,
+                    help="Split files longer than this many lines into concurrently annotated chunks")
+    ap.add_argument("--validation-retries", type=int, default=VALIDATION_RETRIES,
+                    help="Re-requests per file, with a stricter prompt, after truncated or invalid output")
+    ap.add_argument("--max-output-tokens", type=int,
+                    default=int(os.environ.get("AUTODOCS_MAX_OUTPUT_TOKENS", MAX_OUTPUT_TOKENS)),
+                    help="Completion-token limit of the deployment; retry budgets never exceed it")
+    ap.add_argument("--cache-dir", default=os.environ.get("AUTODOCS_CACHE_DIR"),
+                    help="Directory for the persistent response cache (disabled when unset)")
+    ap.add_argument("--cache-max-mb", type=float, default=float(os.environ.get("AUTODOCS_CACHE_MAX_MB", 256)),
+                    help="Evict least-recently-used entries above this size")
+    ap.add_argument("--report", default=os.environ.get("AUTODOCS_REPORT"),
+                    help="Write a run report (.json, or .jsonl for one event per line)")
+    ap.add_argument("--price-prompt", type=float, default=float(os.environ.get("AUTODOCS_PRICE_PROMPT", 0)),
+                    help="USD per 1K prompt tokens, for the cost estimate")
+    ap.add_argument("--price-completion", type=float, default=float(os.environ.get("AUTODOCS_PRICE_COMPLETION", 0)),
+                    help="USD per 1K completion tokens, for the cost estimate")
+    ap.add_argument("--baseline-rev", default=os.environ.get("AUTODOCS_BASELINE_REV"),
+                    help="Git revision holding the last annotated version (e.g. HEAD~1); "
+                         "only regions whose code changed since then are re-annotated")
+    ap.add_argument("--pack-tokens", type=int, default=int(os.environ.get("AUTODOCS_PACK_TOKENS", 0)),
+                    help="Pack files estimated at or below this many tokens several to a request (0 = off)")
+    ap.add_argument("--pack-budget", type=int, default=3000,
+                    help="Maximum estimated code tokens in one packed request")
+    ap.add_argument("--backfill", action="store_true",
+                    help="Annotate through the Azure OpenAI Batch API instead of synchronous requests")
+    ap.add_argument("--state-file", default="autodocs-backfill.json",
+                    help="Backfill progress file; re-run with the same file to resume")
+    ap.add_argument("--batch-size", type=int, default=1000, help="Requests per batch job")
+    ap.add_argument("--poll-interval", type=float, default=60, help="Seconds between batch status checks")
+    ap.add_argument("--batch-deployment", default=os.environ.get("AZURE_OPENAI_BATCH_DEPLOYMENT_NAME"),
+                    help="Global-Batch deployment name (defaults to AZURE_OPENAI_DEPLOYMENT_NAME)")
+    args = ap.parse_args()
+
+    updated_list = pathlib.Path(args.updated_list)
+    repo_root    = pathlib.Path(args.repo_root)
+    scheduler    = Scheduler(args.concurrency, args.rpm, args.tpm, args.max_retries)
+    CHUNK_LINES  = args.chunk_lines
+    VALIDATION_RETRIES = args.validation_retries
+    MAX_OUTPUT_TOKENS  = args.max_output_tokens
+    telemetry    = Telemetry("commenter", args.price_prompt, args.price_completion)
+
+    py_files = [ln.strip() for ln in updated_list.read_text().splitlines() if language_for(ln.strip())]
+    print(f"Found {len(py_files)} sample file(s) to process.")
+
+    BACKEND    = args.backend
+    recordings = pathlib.Path(args.recordings).expanduser() if args.recordings else None
+    if BACKEND == "replay":
+        if recordings is None:
+            ap.error("--backend replay needs --recordings DIR")
+        if args.backfill:
+            ap.error("--backfill needs a live backend (azure, openai or stub)")
+        backend = ReplayBackend(recordings)
+    else:
+        backend = RecordingBackend(ClientBackend(), recordings) if recordings else ClientBackend()
+    if BACKEND != "azure":
+        deployment_name = os.environ.get("OPENAI_MODEL") or "local"   # never the Azure deployment's name
+    # the stub only echoes and replay already answers from disk: neither may fill (or read) the live cache
+    if args.cache_dir and BACKEND in ("azure", "openai"):
+        cache = AnnotationCache(pathlib.Path(args.cache_dir).expanduser(), int(args.cache_max_mb * 1024 * 1024))
+    if BACKEND == "stub" and py_files:
+        from aoai_stub import serve_in_thread          # OpenAI-compatible echo server on a background thread
+        stub = serve_in_thread()
+        os.environ["OPENAI_BASE_URL"] = f"{stub.url}/v1"
+        print(f"Using the local stub LLM at {stub.url}")
+
+    if args.backfill:
+        failed = backfill(py_files, repo_root, pathlib.Path(args.state_file), args.batch_size,
+                          args.poll_interval, args.batch_deployment or deployment_name)
+        telemetry.finish(args.report)
+        sys.exit(1 if failed else 0)
+
+    packs, alone = [], list(py_files)
+    if args.pack_tokens > 0 and py_files:
+        # pre-flight: estimate every file; only Python files re-annotated from scratch can be packed
+        sizes = {rel: estimate_tokens((repo_root / rel).read_text(encoding="utf-8")) for rel in py_files
+                 if language_for(rel) is PYTHON and (repo_root / rel).is_file()
+                 and not (args.baseline_rev and git_baseline(repo_root, args.baseline_rev, rel) is not None)}
+        packs, alone = pack_files(sizes, args.pack_tokens, args.pack_budget)
+        alone += [rel for rel in py_files if rel not in sizes]
+        packed = sum(len(p) for p in packs)
+        system = estimate_tokens(SYSTEM_PROMPT)
+        print(f"Pre-flight: {packed} small file(s) (~{sum(sizes[rel] for p in packs for rel in p)} code tokens) "
+              f"in {len(packs)} packed request(s), {len(alone)} sent alone; "
+              f"~{(packed - len(packs)) * system} system-prompt tokens saved.")
+
+    started  = time.perf_counter()
+    failures = invalid = 0
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as pool:
+        def submit(fn, *fargs):
+            return pool.submit(contextvars.copy_context().run, fn, *fargs)
+        pending = {submit(process_file, rel, repo_root, args.baseline_rev): rel for rel in alone}
+        pending.update({submit(process_pack, pack, repo_root): pack for pack in packs})
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                job = pending.pop(fut)
+                if isinstance(job, list):                      # a pack: retry its rejects one by one
+                    try:
+                        retry = fut.result()
+                        print(f"done pack of {len(job)} ({len(job) - len(retry)} ok, {len(retry)} retried alone)")
+                    except Exception as exc:
+                        retry = job
+                        print(f"Packed request failed ({exc}); retrying its {len(job)} file(s) alone")
+                    pending.update({submit(process_file, rel, repo_root): rel for rel in retry})
+                    continue
+                try:
+                    print(f"done {job} in {fut.result():.2f}s")
+                except Exception as exc:
+                    failures += 1
+                    invalid += isinstance(exc, ValueError)     # rejected output; the file was left untouched
+                    print(f"Failed on {job}: {exc}")
+    if cache:
+        evicted = cache.evict()
+        print(cache.summary() + (f", evicted {evicted} entr{'y' if evicted == 1 else 'ies'}" if evicted else ""))
+    print(f"Processed {len(py_files) - failures}/{len(py_files)} file(s) in {time.perf_counter() - started:.2f}s wall-clock.")
+    retried = len({ev["file"] for ev in telemetry.events if ev.get("stage") == "retry"})
+    if retried or invalid:
+        print(f"Validation: {retried} file(s) retried with a stricter prompt, {invalid} still invalid and left untouched.")
+    telemetry.finish(args.report)
+    if failures:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
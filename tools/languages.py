@@ -0,0 +1,275 @@
+"""
+AutoDocs language plugins – comment syntax, string-literal rules and fence name per file extension.
+
+doc_builder and the commenter look samples up with language_for(path). Python
+is scanned with `tokenize`; the C-family languages share a regex-driven
+streaming scanner that jumps from one comment/string opener to the next, so
+`//` or `/*` inside a string literal is never taken for a comment.
+
+Metadata and step headings use each language's line comment:
+
+    # DOC_TITLE: ...      ### Step heading          (Python)
+    // DOC_TITLE: ...     // ### Step heading       (JavaScript, TypeScript, C#, Go)
+"""
+
+from __future__ import annotations
+import abc, io, pathlib, re, tokenize
+from typing import Iterator
+
+DOC_TAGS = r"DOC_(TITLE|SUMMARY|BLURB|NOTES?|LINKS?|STEP_SUMMARY):\s*(.+)"
+
+
+class Language(abc.ABC):
+    """Base plugin. Subclasses provide comment_spans(); everything else derives from it."""
+
+    def __init__(self, name: str, fence: str, extensions: tuple[str, ...], line_comment: str):
+        self.name, self.fence, self.extensions, self.line_comment = name, fence, extensions, line_comment
+        self.meta_re = re.compile(rf"^{re.escape(line_comment)}\s*{DOC_TAGS}", re.I)     # at column 0
+        self.step_re = re.compile(rf"^{re.escape(line_comment)}\s*###\s+(.*)")          # on comment text
+
+    def __repr__(self) -> str:
+        return f"<Language {self.name}>"
+
+    @abc.abstractmethod
+    def comment_spans(self, text: str) -> Iterator[tuple[int, int]]:
+        """Yield (start, end) offsets of every comment in `text`, in order."""
+
+    def comment_columns(self, lines: list[str]) -> dict[int, int]:
+        """Map 0-based line index -> column where a comment running to the end of that line starts.
+
+        Lines wholly inside a block comment map to their indentation, so they
+        count as comment-only; a block comment followed by code on its line is
+        left to the code.
+        """
+        text = "\n".join(lines)
+        starts = [0]
+        for ln in lines:
+            starts.append(starts[-1] + len(ln) + 1)
+        cols: dict[int, int] = {}
+        line = 0
+        for start, end in self.comment_spans(text):
+            while starts[line + 1] <= start:
+                line += 1
+            last = line
+            while starts[last + 1] <= end - 1:             # line holding the comment's last character
+                last += 1
+            if text[end:starts[last + 1] - 1].strip():
+                if last == line:
+                    continue                         # inline block comment: code follows it
+                last -= 1                            # `*/ code` – its last line stays code
+            cols[line] = start - starts[line]
+            for i in range(line + 1, last + 1):
+                cols[i] = len(lines[i]) - len(lines[i].lstrip())
+        return cols
+
+    def comment_text(self, comment: str) -> str:
+        """Text of a comment-only line with its markers removed (used for step summaries)."""
+        text = re.sub(r"^\s*(?://+|/\*+|\*+(?!/))", "", comment)
+        return re.sub(r"\s*\*+/\s*$", "", text).strip()
+
+    def is_comment_line(self, line: str) -> bool:
+        return line.startswith(self.line_comment)
+
+    def strip_comments(self, code: str) -> str:
+        out, pos = [], 0
+        for start, end in self.comment_spans(code):
+            out.append(code[pos:start])
+            out.append(" ")
+            pos = end
+        out.append(code[pos:])
+        return "".join(out)
+
+    def code_tokens(self, code: str) -> list:
+        """Comment-free token stream used to check that annotation changed nothing but comments."""
+        return self.strip_comments(code).split()
+
+    def check_syntax(self, code: str) -> None:
+        """Raise SyntaxError if `code` is not valid; plugins without a parser accept everything."""
+
+
+# Code and single-line string literals up to the first `#` outside them (or an unterminated quote)
+ONE_LINE_CODE = re.compile(r"""(?:[^'"#]+|"[^"\\]*(?:\\.[^"\\]*)*"|'[^'\\]*(?:\\.[^'\\]*)*')*""")
+FSTRING_RE = re.compile(r"(?<!\w)(?:[fF]|[rR][fF]|[fF][rR])['\"]")
+
+def _one_line_comment(line: str, hash_at: int) -> int | None:
+    """Column of the comment in a line with no multi-line strings, given the line's first `#`."""
+    if hash_at < 0:
+        return None
+    if "'" in line[:hash_at] or '"' in line[:hash_at]:     # the `#` may sit inside a string
+        hash_at = ONE_LINE_CODE.match(line).end()
+        return hash_at if line.startswith("#", hash_at) else None
+    return hash_at
+
+
+class PythonLanguage(Language):
+    def __init__(self):
+        super().__init__("Python", "python", (".py",), "#")
+        self.step_re = re.compile(r"^###\s+(.*)")            # `### Step` is itself the comment
+
+    def comment_columns(self, lines: list[str]) -> dict[int, int]:
+        """Map 0-based line index -> column where that line's comment starts.
+
+        `tokenize` is exact but slow, so it only runs where a line alone cannot
+        be read: a triple quote, a trailing backslash or an f-string with
+        replacement fields. It then covers that whole logical line, so `#`
+        inside docstrings and f-strings is never mistaken for a comment. Every
+        other line is settled by str.find, or by ONE_LINE_CODE when a quote
+        comes before its `#` (escaped quotes included).
+        """
+        cols: dict[int, int] = {}
+        i = 0
+        while i < len(lines):
+            ln = lines[i]
+            hash_at = ln.find("#")
+            multiline = '"""' in ln or "'''" in ln or ln.endswith("\\")       # may continue on later lines
+            if multiline or (hash_at >= 0 and "{" in ln and FSTRING_RE.search(ln)):
+                i = self._tokenize_from(lines, i, cols)
+                continue
+            if hash_at >= 0 and (col := _one_line_comment(ln, hash_at)) is not None:
+                cols[i] = col
+            i += 1
+        return cols
+
+    @staticmethod
+    def _tokenize_from(lines: list[str], start: int, cols: dict[int, int]) -> int:
+        """Record the comments of the logical line starting at `start`; return the index after it."""
+        readline = (lines[j] + "\n" for j in range(start, len(lines))).__next__
+        found: dict[int, int] = {}
+        try:
+            for tok in tokenize.generate_tokens(readline):
+                if tok.type == tokenize.COMMENT:
+                    found[start + tok.start[0] - 1] = tok.start[1]
+                elif tok.type in (tokenize.NEWLINE, tokenize.NL):
+                    cols.update(found)
+                    return start + tok.end[0]
+        except (StopIteration, tokenize.TokenError, SyntaxError):
+            pass
+        col = _one_line_comment(lines[start], lines[start].find("#"))   # malformed: read this line alone
+        if col is not None:
+            cols[start] = col
+        return start + 1
+
+    def comment_spans(self, text: str) -> Iterator[tuple[int, int]]:
+        lines = text.split("\n")
+        cols = self.comment_columns(lines)
+        offset = 0
+        for i, ln in enumerate(lines):
+            if i in cols:
+                yield offset + cols[i], offset + len(ln)
+            offset += len(ln) + 1
+
+    def comment_text(self, comment: str) -> str:
+        return comment.lstrip("# ").rstrip()
+
+    def code_tokens(self, code: str) -> list:
+        """Token stream of `code` with comments and non-logical newlines dropped.
+
+        NEWLINE/ENDMARKER keep only their type, so a missing final newline is not a code change.
+        """
+        skip = (tokenize.COMMENT, tokenize.NL, tokenize.ENCODING)
+        return [(tok.type, "" if tok.type in (tokenize.NEWLINE, tokenize.ENDMARKER) else tok.string)
+                for tok in tokenize.generate_tokens(io.StringIO(code).readline) if tok.type not in skip]
+
+    def check_syntax(self, code: str) -> None:
+        import ast
+        ast.parse(code)
+
+
+class CFamilyLanguage(Language):
+    """`//` and `/* */` comments; `strings` maps each literal opener to the regex matching its remainder.
+
+    Unterminated single-line strings stop at the end of their line, so one
+    stray quote never swallows the rest of the file. JavaScript regex literals
+    are not recognised, so a quote or `//` inside one can confuse the scan.
+    With `newlines`, line breaks count as code (JavaScript's and Go's
+    automatic semicolons make joining two lines a real change).
+    """
+
+    def __init__(self, name: str, fence: str, extensions: tuple[str, ...], strings: dict[str, str],
+                 newlines: bool = False):
+        super().__init__(name, fence, extensions, "//")
+        self.strings = {opener: re.compile(rest, re.S) for opener, rest in strings.items()}
+        openers = sorted(strings, key=len, reverse=True)               # longest first: `"""` before `"`
+        self.opener = re.compile("|".join(["//", r"/\*"] + [re.escape(o) for o in openers]))
+        self.newlines = newlines
+
+    def spans(self, text: str) -> Iterator[tuple[bool, int, int]]:
+        """Yield (is_comment, start, end) for every comment and string literal in `text`, in order."""
+        pos = 0
+        while m := self.opener.search(text, pos):
+            tok, start = m.group(), m.start()
+            if tok == "//":
+                end = text.find("\n", start)
+                pos = len(text) if end < 0 else end
+                yield True, start, pos
+            elif tok == "/*":
+                end = text.find("*/", start + 2)
+                pos = len(text) if end < 0 else end + 2
+                yield True, start, pos
+            else:
+                rest = self.strings[tok].match(text, m.end())
+                pos = rest.end() if rest else m.end()
+                yield False, start, pos
+
+    def comment_spans(self, text: str) -> Iterator[tuple[int, int]]:
+        return ((start, end) for is_comment, start, end in self.spans(text) if is_comment)
+
+    def code_tokens(self, code: str) -> list:
+        """Whitespace-separated code with every string literal kept whole, byte for byte.
+
+        With `newlines`, each run of line breaks (including one inside a block
+        comment) becomes a single "\\n" token, so added blank or comment lines
+        still compare equal but joined or split lines do not.
+        """
+        tokens: list[str] = []
+        pos = 0
+        for is_comment, start, end in self.spans(code):
+            self._words(code[pos:start], tokens)
+            if not is_comment:
+                tokens.append(code[start:end])
+            elif "\n" in code[start:end]:
+                self._words("\n", tokens)
+            pos = end
+        self._words(code[pos:], tokens)
+        if tokens and tokens[-1] == "\n":
+            tokens.pop()
+        return tokens
+
+    def _words(self, chunk: str, tokens: list[str]) -> None:
+        if not self.newlines:
+            tokens.extend(chunk.split())
+            return
+        for i, line in enumerate(chunk.split("\n")):
+            if i and tokens and tokens[-1] != "\n":
+                tokens.append("\n")
+            tokens.extend(line.split())
+
+
+ESCAPED = r'(?:[^{q}\\\n]|\\.)*(?:{q}|(?=\n)|$)'             # "..." / '...' with backslash escapes
+
+def _quoted(q: str) -> str:
+    return ESCAPED.format(q=q)
+
+JS_STRINGS = {'"': _quoted('"'), "'": _quoted("'"), "`": r"(?:[^`\\]|\\.)*`?"}      # `template` may span lines
+
+JAVASCRIPT = CFamilyLanguage("JavaScript", "javascript", (".js", ".mjs", ".cjs", ".jsx"), JS_STRINGS, newlines=True)
+TYPESCRIPT = CFamilyLanguage("TypeScript", "typescript", (".ts", ".tsx"), JS_STRINGS, newlines=True)
+CSHARP = CFamilyLanguage("C#", "csharp", (".cs",), {
+    '"""': r'.*?"""',                                  # raw string literal (C# 11)
+    '$"""': r'.*?"""', '$$"""': r'.*?"""',
+    '@"': r'(?:[^"]|"")*"?', '$@"': r'(?:[^"]|"")*"?', '@$"': r'(?:[^"]|"")*"?',   # verbatim: "" escapes
+    '"': _quoted('"'), '$"': _quoted('"'), "'": _quoted("'"),
+})
+GO = CFamilyLanguage("Go", "go", (".go",),
+                     {'"': _quoted('"'), "'": _quoted("'"), "`": r"[^`]*`?"},   # raw strings have no escapes
+                     newlines=True)
+
+PYTHON = PythonLanguage()
+
+LANGUAGES: dict[str, Language] = {ext: lang for lang in (PYTHON, JAVASCRIPT, TYPESCRIPT, CSHARP, GO)
+                                  for ext in lang.extensions}
+
+
+def language_for(path: str | pathlib.PurePath) -> Language | None:
+    """The plugin registered for `path`'s extension, or None for unsupported files."""
+    return LANGUAGES.get(pathlib.PurePath(path).suffix.lower())
@@ -0,0 +1,132 @@
+"""
+AutoDocs run telemetry – per-file/per-stage spans, token usage and cost.
+
+Both tools record into a module-level Telemetry instance and, at the end of
+a run, write a JSON (or JSONL) report and append a table to the GitHub step
+summary when $GITHUB_STEP_SUMMARY is set.
+"""
+
+from __future__ import annotations
+import contextlib, datetime, json, os, pathlib, threading, time
+
+
+class Telemetry:
+    """Thread-safe collector of timed spans and LLM token usage."""
+
+    def __init__(self, tool: str, price_prompt: float = 0.0, price_completion: float = 0.0):
+        self.tool = tool
+        self.price_prompt, self.price_completion = price_prompt, price_completion   # USD per 1K tokens
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.t0 = time.perf_counter()
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _add(self, event: dict) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, stage: str, file: str | None = None, **attrs):
+        """Time the enclosed block as one `stage` span, attributed to `file` if given."""
+        wall, start = time.time(), time.perf_counter()   # epoch start so worker-process spans line up
+        try:
+            yield attrs                      # callers may add attributes while the span is open
+        finally:
+            self._add({"type": "span", "stage": stage, "file": file,
+                       "start": round(wall, 6), "seconds": round(time.perf_counter() - start, 6), **attrs})
+
+    def usage(self, file: str | None, prompt_tokens: int, completion_tokens: int, cached: bool = False) -> None:
+        self._add({"type": "usage", "file": file, "prompt_tokens": prompt_tokens,
+                   "completion_tokens": completion_tokens, "cached": cached})
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Collect events from the enclosed block into a separate list (e.g. to ship back from a worker)."""
+        saved = self.events
+        self.events = captured = []
+        try:
+            yield captured
+        finally:
+            self.events = saved
+
+    def extend(self, events: list[dict]) -> None:
+        with self._lock:
+            self.events.extend(events)
+
+    def summary(self) -> dict:
+        stages: dict[str, dict] = {}
+        files: dict[str, dict] = {}
+        tokens = {"requests": 0, "cached": 0, "prompt": 0, "completion": 0}
+        for ev in self.events:
+            f = files.setdefault(ev["file"], {"seconds": 0.0, "stages": {}, "prompt_tokens": 0,
+                                              "completion_tokens": 0, "_first": None, "_last": 0.0}) if ev["file"] else None
+            if ev["type"] == "span":
+                st = stages.setdefault(ev["stage"], {"count": 0, "seconds": 0.0})
+                st["count"] += 1
+                st["seconds"] += ev["seconds"]
+                if f is not None:
+                    f["stages"][ev["stage"]] = round(f["stages"].get(ev["stage"], 0.0) + ev["seconds"], 6)
+                    # per-file time is wall-clock from its first span to its last (spans may overlap)
+                    f["_first"] = ev["start"] if f["_first"] is None else min(f["_first"], ev["start"])
+                    f["_last"] = max(f["_last"], ev["start"] + ev["seconds"])
+                    f["seconds"] = round(f["_last"] - f["_first"], 6)
+            else:
+                tokens["cached" if ev["cached"] else "requests"] += 1
+                tokens["prompt"] += ev["prompt_tokens"]
+                tokens["completion"] += ev["completion_tokens"]
+                if f is not None:
+                    f["prompt_tokens"] += ev["prompt_tokens"]
+                    f["completion_tokens"] += ev["completion_tokens"]
+        for st in stages.values():
+            st["seconds"] = round(st["seconds"], 6)
+        for f in files.values():
+            del f["_first"], f["_last"]
+        cost = (tokens["prompt"] * self.price_prompt + tokens["completion"] * self.price_completion) / 1000
+        return {"tool": self.tool, "started": self.started.isoformat(timespec="seconds"),
+                "wall_seconds": round(time.perf_counter() - self.t0, 6), "stages": stages, "tokens": tokens,
+                "estimated_cost_usd": round(cost, 6), "files": files}
+
+    def write(self, path: str | os.PathLike) -> None:
+        """Write the report: `.jsonl` gets one event per line plus a summary line, anything else one JSON doc."""
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary()
+        with path.open("w", encoding="utf-8") as fh:
+            if path.suffix == ".jsonl":
+                for ev in self.events:
+                    fh.write(json.dumps(ev) + "\n")
+                fh.write(json.dumps({"type": "summary", **summary}) + "\n")
+            else:
+                json.dump({**summary, "events": self.events}, fh, indent=1)
+                fh.write("\n")
+
+    def step_summary(self, slowest: int = 10) -> str:
+        s = self.summary()
+        out = [f"### AutoDocs `{self.tool}` run", "",
+               f"Wall-clock: **{s['wall_seconds']:.2f}s** across {len(s['files'])} file(s)", "",
+               "| Stage | Count | Total (s) |", "|---|---:|---:|"]
+        out += [f"| {name} | {st['count']} | {st['seconds']:.3f} |" for name, st in s["stages"].items()]
+        t = s["tokens"]
+        if t["requests"] or t["cached"]:
+            out += ["", f"LLM requests: **{t['requests']}** (+{t['cached']} cached), "
+                        f"prompt tokens: **{t['prompt']}**, completion tokens: **{t['completion']}**, "
+                        f"estimated cost: **${s['estimated_cost_usd']:.4f}**"]
+        if s["files"]:
+            ranked = sorted(s["files"].items(), key=lambda kv: kv[1]["seconds"], reverse=True)[:slowest]
+            if t["prompt"] or t["completion"]:
+                out += ["", "| Slowest files | Time (s) | Tokens |", "|---|---:|---:|"]
+                out += [f"| `{name}` | {f['seconds']:.3f} | {f['prompt_tokens'] + f['completion_tokens']} |"
+                        for name, f in ranked]
+            else:
+                out += ["", "| Slowest files | Time (s) |", "|---|---:|"]
+                out += [f"| `{name}` | {f['seconds']:.3f} |" for name, f in ranked]
+        return "\n".join(out) + "\n"
+
+    def finish(self, report_path: str | None) -> None:
+        """Write the report (if requested) and the GitHub step summary (if running in Actions)."""
+        if report_path:
+            self.write(report_path)
+            print(f"Wrote run report to {report_path}")
+        if gh := os.environ.get("GITHUB_STEP_SUMMARY"):
+            with open(gh, "a", encoding="utf-8") as fh:
+                fh.write(self.step_summary() + "\n")